@@ -0,0 +1,255 @@
+import asyncio, os, time, threading
+import SCLCommand
+from SCLCommand import SCLError, SCLTimeoutError
+
+# the event loop every async exchange runs on, started on first use
+background = None
+
+# how often a marker awaited without holding the bus is looked for, in seconds
+MARKER_POLL = 0.05
+
+
+def background_loop():
+    """
+    Returns the background event loop, starting its thread the first time.
+    A port can only be watched by one loop, so all async work, from the
+    synchronous wrappers and the motion queues alike, shares this one.
+    """
+    global background
+    if background is None:
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="motion", daemon=True).start()
+        background = loop
+    return background
+
+
+def run(coro):
+    """
+    Runs coro on the background loop and waits for its result
+    """
+    return asyncio.run_coroutine_threadsafe(coro, background_loop()).result()
+
+
+class AsyncTransport:
+    """
+    Event loop side of a serial port (an SCLBus). The port's file descriptor
+    is put in non-blocking mode and watched by the running event loop, bytes
+    that arrive go into the bus's frame buffer (the same one that
+    SCLBus.read_frame uses) and wake up whoever is waiting for a reply.
+    Several transports on different ports can then share one loop.
+    """
+    def __init__(self, bus):
+        self.bus = bus
+        self.loop = None
+        self.thread = None
+        self.fd = -1
+        self.data_ready = None
+
+    def attach(self) -> None:
+        """
+        Registers the port with the running loop, a no-op if already done.
+        A closed loop forgets its readers, so a new loop registers again.
+        """
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.detach()
+        if not self.bus.ser.isOpen():
+            raise SCLError("", "serial port is not open")
+        self.fd = self.bus.ser.fileno()
+        os.set_blocking(self.fd, False)
+        self.data_ready = asyncio.Event()
+        loop.add_reader(self.fd, self.on_readable)
+        self.loop = loop
+        self.thread = threading.current_thread()
+
+    def detach(self) -> None:
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.remove_reader(self.fd)
+        self.loop = None
+
+    def elsewhere(self) -> bool:
+        """
+        True if the port is watched by a loop running in another thread.
+        Reads from this thread would then race that loop's reader, so
+        synchronous exchanges are handed to the loop with call instead.
+        """
+        return (self.loop is not None and self.loop.is_running() and
+            self.thread is not threading.current_thread())
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def on_readable(self) -> None:
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Error reading from {self.bus.port}: {e}")
+            self.detach()
+            return
+        if len(data) > 0:
+            self.bus.rx_buffer += data
+            self.data_ready.set()
+
+    async def acquire(self, address: str) -> None:
+        """
+        Takes address's turn on the bus. When others are waiting the fair
+        scheduler in SCLBus is used from a worker thread so the loop keeps
+        running meanwhile.
+        """
+        if self.bus.try_acquire(address):
+            gap = self.bus.turnaround - (time.monotonic() - self.bus.released_at)
+            if gap > 0:
+                await asyncio.sleep(gap)
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.bus.acquire, address)
+
+    async def read_frame(self, timeout: float):
+        """
+        Async counterpart of SCLBus.read_frame
+        """
+        self.attach()
+        deadline = self.loop.time() + timeout
+        rx_buffer = self.bus.rx_buffer
+        while True:
+            end = rx_buffer.find(b"\r")
+            if end >= 0:
+                frame = bytes(rx_buffer[:end])
+                del rx_buffer[:end + 1]
+                self.bus.note_marker(frame)
+                return frame
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return None
+            self.data_ready.clear()
+            try:
+                await asyncio.wait_for(self.data_ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    def write(self, data: bytes) -> None:
+        self.attach()
+        # only waits if the driver's transmit buffer is full, which frames this short don't do
+        self.bus.write_bytes(data)
+
+    async def flush_input(self) -> None:
+        """
+        Async counterpart of SCLBus.flush_input
+        """
+        self.discard_input()
+
+    def discard_input(self) -> None:
+        self.bus.keep_markers()
+        self.bus.ser.reset_input_buffer()
+        self.bus.rx_buffer.clear()
+
+    async def wait_reply(self, address: str, command: str, spec, deadline: float, start: float, attempt: int = 1):
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            frame = await self.read_frame(remaining)
+            if frame is None:
+                return None
+            text = SCLCommand.strip_address(address, frame.decode(errors="replace"))
+            if spec.accept(command, text):
+                return SCLCommand.SCLReply(command, text, spec.parse(command, text), attempt, time.monotonic() - start)
+
+    async def transact(self, address: str, command: str, timeout: float = None, retries: int = None):
+        """
+        Async counterpart of SCLBus.transact
+        """
+        self.attach()
+        await self.acquire(address)
+        try:
+            return await self.exchange(address, command, timeout, retries)
+        finally:
+            self.bus.release()
+
+    async def exchange(self, address: str, command: str, timeout: float = None, retries: int = None):
+        spec = SCLCommand.lookup(command)
+        if spec is None or not spec.expects_reply(command):
+            self.write(SCLCommand.encode(address, command))
+            if spec is not None and spec.settle > 0:
+                await asyncio.sleep(spec.settle)
+            return None
+        if timeout is None:
+            timeout = spec.timeout
+        if retries is None:
+            retries = spec.retries
+        start = time.monotonic()
+        for attempt in range(1, retries + 2):
+            self.discard_input()
+            self.write(SCLCommand.encode(address, command))
+            reply = await self.wait_reply(address, command, spec, time.monotonic() + timeout, start, attempt)
+            if reply is not None:
+                return reply
+        raise SCLTimeoutError(command, timeout, retries + 1)
+
+    async def transact_batch(self, address: str, commands: list, timeout: float = None) -> list:
+        """
+        Async counterpart of SCLBus.transact_batch
+        """
+        if len(commands) == 0:
+            return []
+        self.attach()
+        await self.acquire(address)
+        try:
+            specs = [SCLCommand.lookup(c) for c in commands]
+            answering = [spec is not None and spec.expects_reply(c) and (address, c) not in self.bus.markers
+                for c, spec in zip(commands, specs)]
+            if any(answering):
+                self.discard_input()
+            start = time.monotonic()
+            nbytes = 0
+            writes = SCLCommand.split_batch(address, commands)
+            for i, (chunk, settle) in enumerate(writes):
+                self.write(chunk)
+                nbytes += len(chunk)
+                if i < len(writes) - 1:
+                    settle = max(settle, len(chunk) * 10.0 / self.bus.ser.baudrate)
+                if settle > 0:
+                    await asyncio.sleep(settle)
+            wire_time = nbytes * 10.0 / self.bus.ser.baudrate
+            results = []
+            for command, spec, answers in zip(commands, specs, answering):
+                if not answers:
+                    results.append(None)
+                    continue
+                reply_timeout = spec.timeout if timeout is None else timeout
+                reply = await self.wait_reply(address, command, spec, time.monotonic() + reply_timeout + wire_time, start)
+                wire_time = 0
+                if reply is None:
+                    reply = await self.exchange(address, command, timeout)
+                results.append(reply)
+            return results
+        finally:
+            self.bus.release()
+
+    async def transact_marked(self, address: str, commands: list, timeout: float) -> list:
+        """
+        Async counterpart of SCLBus.transact_marked
+        """
+        markers = self.bus.markers
+        marker = commands[-1]
+        markers[(address, marker)] = None
+        try:
+            results = await self.transact_batch(address, commands)
+            start = time.monotonic()
+            while markers[(address, marker)] is None:
+                if time.monotonic() - start > timeout:
+                    raise SCLTimeoutError(marker, timeout, 1)
+                await asyncio.sleep(MARKER_POLL)
+                await self.acquire(address)
+                try:
+                    while await self.read_frame(0.0) is not None:
+                        pass
+                finally:
+                    self.bus.release()
+            text = markers[(address, marker)]
+        finally:
+            del markers[(address, marker)]
+        results[-1] = SCLCommand.SCLReply(marker, text, text, 1, time.monotonic() - start)
+        return results
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+
+
+def table_file(control) -> str:
+    """
+    Where an axis' calibration table is kept, next to its log
+    """
+    return control.logger.name + ".cal"
+
+
+class CalibrationTable:
+    """
+    Measured positions (deg or mm) of an axis at drive positions (steps,
+    in the frame calibrate sets with SP0), for actuators whose gearing or
+    lead screw is not quite linear. Conversions interpolate linearly
+    between the points, and carry on along the first or last segment
+    beyond them. The measured positions have to rise or fall steadily
+    with the steps so the table can be read both ways. Both ways are
+    kept sorted for np.interp, so a conversion costs one binary search,
+    for a single value or an array of them.
+    """
+    def __init__(self, steps: list = (), measured: list = ()):
+        self.points = {int(s): float(m) for s, m in zip(steps, measured)}
+        self.prepare()
+
+    def add(self, steps: int, measured: float) -> None:
+        """
+        Records that the axis measured measured at drive position steps,
+        replacing any earlier point at the same steps. Raises ValueError
+        if that would break the steady rise or fall of the table.
+        """
+        points = dict(self.points)
+        points[int(steps)] = float(measured)
+        old = self.points
+        self.points = points
+        try:
+            self.prepare()
+        except ValueError:
+            self.points = old
+            self.prepare()
+            raise
+
+    def prepare(self) -> None:
+        steps = np.array(sorted(self.points), dtype=np.float64)
+        measured = np.array([self.points[int(s)] for s in steps], dtype=np.float64)
+        rises = np.diff(measured)
+        if len(rises) > 0 and not (np.all(rises > 0) or np.all(rises < 0)):
+            raise ValueError("Measured positions must rise or fall steadily with the steps!")
+        self.steps = steps
+        self.measured = measured
+        order = np.argsort(measured)
+        self.inverse_measured = measured[order]
+        self.inverse_steps = steps[order]
+        self.ends = None
+        if len(steps) >= 2:
+            self.ends = (self.slopes(steps, measured), self.slopes(self.inverse_measured, self.inverse_steps))
+
+    @staticmethod
+    def slopes(x, y):
+        return (y[1] - y[0]) / (x[1] - x[0]), (y[-1] - y[-2]) / (x[-1] - x[-2])
+
+    def usable(self) -> bool:
+        return len(self.steps) >= 2
+
+    @staticmethod
+    def interpolate(x, xp, fp, ends):
+        low, high = ends
+        y = np.interp(x, xp, fp)
+        y = np.where(x < xp[0], fp[0] + (x - xp[0]) * low, y)
+        y = np.where(x > xp[-1], fp[-1] + (x - xp[-1]) * high, y)
+        if np.ndim(y) == 0:
+            return float(y)
+        return y
+
+    def value(self, steps):
+        """
+        Position in deg or mm at drive position(s) steps
+        """
+        return self.interpolate(np.asarray(steps, dtype=np.float64), self.steps, self.measured, self.ends[0])
+
+    def position(self, value):
+        """
+        Drive position(s) in steps, not rounded, of value(s) in deg or mm
+        """
+        return self.interpolate(np.asarray(value, dtype=np.float64), self.inverse_measured, self.inverse_steps, self.ends[1])
+
+    def __len__(self):
+        return len(self.points)
+
+
+def load_table(control):
+    """
+    The axis' calibration table, None if it has none or it can't be read
+    """
+    file_name = table_file(control)
+    if not os.path.exists(file_name):
+        return None
+    try:
+        data = np.loadtxt(file_name, ndmin=2)
+        return CalibrationTable(data[:, 0], data[:, 1])
+    except (ValueError, IndexError) as e:
+        print(f"Ignoring unreadable calibration table {file_name}: {e}")
+        return None
+
+
+def save_table(control, table: CalibrationTable) -> None:
+    np.savetxt(table_file(control), np.column_stack([table.steps, table.measured]), fmt=["%d", "%.6f"],
+        header="steps   measured(deg or mm)")
@@ -0,0 +1,80 @@
+import time
+import SCLCommand
+
+# the manual asks not to send more buffered commands once fewer than this
+# many characters are free in the command buffer
+LOW_WATER = 20
+
+# while a WT runs the manual asks for 20 ms between commands
+WAIT_GAP = 0.02
+
+
+class CommandStream:
+    """
+    Streams a sequence of buffered commands that is longer than the drive's
+    128 character command buffer, following APPN0048 and the notes on the
+    buffers in the SCL manual. The buffer is kept topped up so moves and
+    waits run back to back on the drive with no host round trip between
+    them.
+
+    The host keeps its own count of the free space. Commands are written
+    while they fit above LOW_WATER, and BS is only asked again once the
+    count says the buffer is full, so the drive is polled about once per
+    command it finishes rather than once per command sent. Each write and
+    BS exchange is its own turn on the bus, other drives on it are served
+    in between.
+    """
+    def __init__(self, control, poll: float = 0.05):
+        self.control = control
+        self.poll = poll
+        self.writes = 0
+        self.bs_queries = 0
+
+    def free(self) -> int:
+        self.bs_queries += 1
+        return self.control.query("BS")
+
+    def run(self, commands: list, marker: str, timeout: float) -> None:
+        """
+        Streams commands, then sends marker (an SS command) and waits up to
+        timeout seconds for it to come back, which happens once every
+        command before it has run. Raises SCLError if the marker doesn't
+        come back or a BS exchange fails.
+        """
+        control = self.control
+        bus = control.bus
+        address = control.address
+        waits = any(c.startswith("WT") for c in commands)
+        free = self.free()
+        i = 0
+        while i < len(commands):
+            chunk = b""
+            settle = WAIT_GAP if waits else 0.0
+            while i < len(commands):
+                frame = SCLCommand.encode(address, commands[i])
+                if free - len(frame) < LOW_WATER or len(chunk) + len(frame) > SCLCommand.RECEIVE_BUFFER_SIZE:
+                    break
+                chunk += frame
+                free -= len(frame)
+                i += 1
+                spec = SCLCommand.lookup(commands[i - 1])
+                # these need the line quiet after them, so they end the write
+                if waits or (spec is not None and spec.settle > 0):
+                    if spec is not None:
+                        settle = max(settle, spec.settle)
+                    break
+            if len(chunk) == 0:
+                time.sleep(self.poll)
+                free = self.free()
+                continue
+            with bus.turn(address):
+                bus.write_bytes(chunk)
+                if settle > 0:
+                    time.sleep(settle)
+            self.writes += 1
+
+        frame = SCLCommand.encode(address, marker)
+        while free - len(frame) < LOW_WATER:
+            time.sleep(self.poll)
+            free = self.free()
+        control.transact_marked([marker], timeout)
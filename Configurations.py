@@ -0,0 +1,229 @@
+import os, time
+import AsyncTransport
+import GroupMove
+
+
+class Rule:
+    """
+    A collision rule between two motors.
+    order A B:      if both move, A finishes before B starts
+    clear A SAFE B: B only moves while A is at SAFE, A is moved there first
+                    if needed and back to where it belongs afterwards
+    """
+    def __init__(self, kind: str, first: str, second: str, safe: str = None):
+        self.kind = kind
+        self.first = first
+        self.second = second
+        self.safe = safe
+
+    def __str__(self):
+        if self.kind == "clear":
+            return "clear {} {} {}".format(self.first, self.safe, self.second)
+        return "order {} {}".format(self.first, self.second)
+
+
+class Configurations:
+    """
+    Named multi-axis configurations, e.g. "data": FP2_L1 IN and FP2_R1 at
+    45 deg, and the collision rules to respect going from one to another,
+    kept in a text file next to stepper.cfg:
+
+        config  data  FP2_L1=IN  FP2_R1=45.0
+        clear   FP2_L1  OUT  FP2_R1
+        order   FP1_L1  FP1_R1
+
+    Targets are IN/OUT (linear only) or positions (deg or mm) as for move.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        # name -> [(motor name, target), ...]
+        self.configs = {}
+        self.rules = []
+        if os.path.exists(file_name):
+            self.load()
+
+    def load(self) -> None:
+        with open(self.file_name) as fp:
+            for number, line in enumerate(fp.readlines(), 1):
+                spl = line.split()
+                if len(spl) == 0 or spl[0][0] == "#":
+                    continue
+                if spl[0] == "config" and len(spl) >= 3 and all("=" in i for i in spl[2:]):
+                    self.configs[spl[1]] = [tuple(i.split("=", 1)) for i in spl[2:]]
+                elif spl[0] == "order" and len(spl) == 3:
+                    self.rules.append(Rule("order", spl[1], spl[2]))
+                elif spl[0] == "clear" and len(spl) == 4:
+                    self.rules.append(Rule("clear", spl[1], spl[3], spl[2]))
+                else:
+                    print(f"Ignoring line {number} of {self.file_name}: {line.strip()}")
+
+    def save(self) -> None:
+        with open(self.file_name, "w") as fp:
+            fp.write("# config <name> <motor>=<IN/OUT or position> ...\n")
+            for name in self.configs:
+                fp.write("config  {}  {}\n".format(name, "  ".join("{}={}".format(m, t) for m, t in self.configs[name])))
+            fp.write("# order <first motor> <second motor>, clear <motor> <safe IN/OUT or position> <motor>\n")
+            for rule in self.rules:
+                fp.write(str(rule) + "\n")
+
+    def define(self, name: str, pairs: list) -> None:
+        self.configs[name] = pairs
+        self.save()
+
+    def list(self) -> None:
+        if len(self.configs) == 0:
+            print(f"No configurations in {self.file_name}")
+        for name in self.configs:
+            print("{:12s} {}".format(name, "  ".join("{}={}".format(m, t) for m, t in self.configs[name])))
+        for rule in self.rules:
+            print(rule)
+
+
+def at(control, target: float) -> bool:
+    return control.position_of(target) == control.targetedPosition
+
+
+class Planner:
+    """
+    Works out how to bring a set of motors to a configuration as quickly
+    as the collision rules allow. Every move that has to happen is made a
+    step, steps that depend on each other through a rule go into
+    consecutive stages, and the motors of a stage all move at once, so a
+    stage takes as long as its slowest move.
+    """
+    def __init__(self, controllers: list, rules: list):
+        self.controllers = {c.name: c for c in controllers}
+        self.rules = rules
+
+    def plan(self, pairs: list):
+        """
+        Returns the stages, each a list of (controller, target) pairs, to
+        reach pairs of (motor name, target), or None if that can't be done
+        """
+        targets = {}
+        for name, target in pairs:
+            if name not in self.controllers:
+                print(f"No motor named {name}!")
+                return None
+            control = self.controllers[name]
+            try:
+                targets[name] = control.parse_target(target)
+            except ValueError:
+                print(f"Invalid target {target} for {name}! IN/OUT (linear only) or position (mm/deg)")
+                return None
+
+        # steps are [motor name, target, steps it waits for]
+        steps = []
+        final = {}
+        for name in targets:
+            if not at(self.controllers[name], targets[name]):
+                final[name] = [name, targets[name], []]
+                steps.append(final[name])
+
+        for rule in self.rules:
+            if rule.first not in self.controllers or rule.second not in self.controllers:
+                print(f"Rule '{rule}' names a motor that doesn't exist!")
+                return None
+        # motor name -> its step to the safe position of a clear rule
+        clearing = {}
+        for rule in [r for r in self.rules if r.kind == "clear"] + [r for r in self.rules if r.kind == "order"]:
+            if rule.second not in final:
+                continue
+            moving = final[rule.second]
+            if rule.kind == "order":
+                if rule.first in final:
+                    moving[2].append(final[rule.first])
+                continue
+            first = self.controllers[rule.first]
+            try:
+                safe = first.parse_target(rule.safe)
+            except ValueError:
+                print(f"Invalid safe position {rule.safe} in rule '{rule}'! IN/OUT (linear only) or position (mm/deg)")
+                return None
+            own = final.get(rule.first)
+            if at(first, safe):
+                # it may only leave the safe position once the other motor is done
+                if own is not None:
+                    own[2].append(moving)
+            elif own is not None and first.position_of(own[1]) == first.position_of(safe):
+                # on its way to the safe position anyway
+                moving[2].append(own)
+            else:
+                if rule.first in clearing and first.position_of(clearing[rule.first][1]) != first.position_of(safe):
+                    # it can't be at both while the motors they clear move
+                    print(f"{rule.first} has to clear to both {clearing[rule.first][1]:.5f} and {safe:.5f}, no plan!")
+                    return None
+                if rule.first not in clearing:
+                    clearing[rule.first] = [rule.first, safe, []]
+                    steps.append(clearing[rule.first])
+                moving[2].append(clearing[rule.first])
+                if own is None:
+                    # back to where it was afterwards
+                    own = [rule.first, first.get_target(), []]
+                    steps.append(own)
+                    final[rule.first] = own
+                own[2].append(moving)
+
+        stages = []
+        placed = {}
+        while len(placed) < len(steps):
+            ready = [s for s in steps if id(s) not in placed and all(id(w) in placed for w in s[2])]
+            if len(ready) == 0:
+                print("The collision rules contradict each other, no plan!")
+                return None
+            stage = {}
+            for s in ready:
+                if s[0] in stage:
+                    continue
+                stage[s[0]] = s
+            for s in stage.values():
+                placed[id(s)] = len(stages)
+            stages.append([(self.controllers[s[0]], s[1]) for s in stage.values()])
+        return stages
+
+    @staticmethod
+    def predict(stages: list) -> float:
+        """
+        Predicted time of the stages run one after the other
+        """
+        where = {}
+        total = 0.0
+        for stage in stages:
+            total += max(c.predict_move_time(t - where.get(c.name, c.get_target())) for c, t in stage)
+            for c, t in stage:
+                where[c.name] = t
+        return total
+
+    @staticmethod
+    def show(stages: list) -> None:
+        for i, stage in enumerate(stages):
+            moves = ", ".join("{} -> {:.5f}".format(c.name, t) for c, t in stage)
+            print("Stage {}: {}".format(i + 1, moves))
+
+
+async def async_run_plan(stages: list) -> bool:
+    """
+    Runs the stages one after the other, each as a group move, reporting
+    progress. Stops if a stage doesn't bring every motor to its target.
+    """
+    for stage in stages:
+        if not GroupMove.check_group(stage):
+            print("Plan not executed!")
+            return False
+    start = time.monotonic()
+    predicted = Planner.predict(stages)
+    for i, stage in enumerate(stages):
+        names = ", ".join(c.name for c, t in stage)
+        print("Stage {}/{}: {}".format(i + 1, len(stages), names))
+        if await GroupMove.async_move_group(stage) is None:
+            return False
+        for control, target in stage:
+            if not at(control, target) or not control.position_known():
+                print(f"{control.name} did not reach {target:.5f}, plan stopped!")
+                return False
+    print("Configuration reached in {:.2f} s, predicted {:.2f} s".format(time.monotonic() - start, predicted))
+    return True
+
+
+def run_plan(stages: list) -> bool:
+    return AsyncTransport.run(async_run_plan(stages))
@@ -0,0 +1,141 @@
+import asyncio, time
+import SCLCommand
+import AsyncTransport
+
+
+def check_group(targets: list) -> bool:
+    """
+    Checks every axis of a group move before any of them moves, so a
+    group either starts as a whole or not at all. targets is a list of
+    (controller, absolute target in deg or mm) pairs.
+    """
+    if len(targets) == 0:
+        print("No axes given!")
+        return False
+    names = []
+    for control, target in targets:
+        if control.name in names:
+            print(f"{control.name} is given more than once!")
+            return False
+        names.append(control.name)
+        if not control.booted:
+            print(f"{control.name} is not booted!")
+            return False
+        if not control.in_valid_range(target):
+            print("Move would put {} out of range! Limits: ({}, {}), Given:{}".format(control.name, control.lowerLimit, control.upperLimit, target))
+            return False
+    return True
+
+
+async def async_move_group(targets: list):
+    """
+    Moves every axis in targets to its target at the same time and waits
+    for all of them, the group takes as long as its slowest axis. Returns
+    the elapsed time, or None if the group was not started.
+    """
+    if not check_group(targets):
+        print("Group move not executed!")
+        return None
+    predicted = max(control.predict_move_time(target - control.get_target()) for control, target in targets)
+    start = time.monotonic()
+    results = await asyncio.gather(*[control.async_move_absolute(target) for control, target in targets], return_exceptions=True)
+    elapsed = time.monotonic() - start
+    for (control, target), result in zip(targets, results):
+        if isinstance(result, Exception):
+            print(f"Move of {control.name} failed: {result}")
+    print(f"Group move finished in {elapsed:.2f} s, slowest axis predicted {predicted:.2f} s")
+    return elapsed
+
+
+def move_group(targets: list):
+    return AsyncTransport.run(async_move_group(targets))
+
+
+async def async_trigger(controls: list) -> dict:
+    """
+    Sends CT to every controller in one tight burst, one write per bus
+    holding the CT of every drive on it, with all the buses' turns taken
+    first so nothing else gets in between. The turns are taken through
+    the async transport so the loop keeps serving the others meanwhile.
+    Returns the estimated time (time.perf_counter) each drive received
+    its CT: when its bus's write was handed to the port plus the wire
+    time of the frames up to and including its own.
+    """
+    buses = []
+    for control in controls:
+        if control.bus not in buses:
+            buses.append(control.bus)
+    frames = [b"".join(SCLCommand.encode(c.address, "CT") for c in controls if c.bus is bus) for bus in buses]
+    held = []
+    try:
+        for bus in buses:
+            await bus.transport.acquire("")
+            held.append(bus)
+        written = []
+        for bus, frame in zip(buses, frames):
+            written.append(time.perf_counter())
+            bus.write_bytes(frame)
+    finally:
+        for bus in held:
+            bus.release()
+    starts = {}
+    for bus, t in zip(buses, written):
+        nbytes = 0
+        for control in controls:
+            if control.bus is bus:
+                nbytes += len(SCLCommand.encode(control.address, "CT"))
+                # 10 bits per character
+                starts[control] = t + nbytes * 10.0 / bus.ser.baudrate
+    return starts
+
+
+async def async_move_group_synchronized(targets: list):
+    """
+    Like async_move_group, but every drive is paused (PS) and loaded with
+    its move first, then all of them are started together with CT, see
+    async_trigger. Reports the estimated skew between the first and the
+    last CT reaching its drive and returns it in seconds, or None if the
+    group was not started. The estimate comes from the host's write times
+    and the wire time, nothing is measured on the drives.
+    """
+    if not check_group(targets):
+        print("Group move not executed!")
+        return None
+    for control, target in targets:
+        if (not await control.async_validate_position(True) or not await control.async_is_motor_on(True)):
+            print(f"Group move not executed, {control.name} is not ready!")
+            return None
+
+    moves = [control.position_of(target) - control.targetedPosition for control, target in targets]
+    controls = [control for control, target in targets]
+    try:
+        await asyncio.gather(*[
+            control.async_transact_batch(["PS"] + control.register_commands(control.move_registers()) + ["FL{}".format(t_steps)])
+            for control, t_steps in zip(controls, moves)])
+    except Exception as e:
+        print(f"Failed to load the moves, clearing them!\n{e}")
+        for control in controls:
+            control.invalidate_cache()
+            await control.async_transact_batch(["SK", "CT"])
+        return None
+    for control in controls:
+        control.note_registers(control.move_registers())
+
+    starts = await async_trigger(controls)
+    estimated_skew = max(starts.values()) - min(starts.values())
+    for control, t_steps in zip(controls, moves):
+        position = control.targetedPosition + t_steps
+        control.set_target(control.value_of(position), position)
+        control.previous_move = t_steps
+    print(f"Started {len(controls)} axes, estimated skew between first and last CT {estimated_skew * 1000.0:.2f} ms (host side, not measured)")
+
+    await asyncio.gather(*[control.async_wait_for_move(control.steps_to_time(t_steps)) for control, t_steps in zip(controls, moves)])
+    for control in controls:
+        control.make_log_entry()
+        await control.async_validate_position()
+    print(" Group move finished")
+    return estimated_skew
+
+
+def move_group_synchronized(targets: list):
+    return AsyncTransport.run(async_move_group_synchronized(targets))
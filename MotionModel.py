@@ -0,0 +1,75 @@
+import math
+import numpy as np
+
+
+class MotionModel:
+    """
+    Time a point to point move takes on the drive. The drive ramps up at
+    AC (rev/sec/sec) to VE (rev/sec), cruises, and ramps down at DE. A
+    move too short to reach VE ramps straight from accelerating to
+    decelerating, a triangular profile. Distances are in drive steps,
+    steps_per_rev is the drive resolution (MR).
+    """
+    def __init__(self, accel: float, decel: float, velocity: float, steps_per_rev: float):
+        self.accel = float(accel)
+        self.decel = float(decel)
+        self.velocity = float(velocity)
+        self.steps_per_rev = float(steps_per_rev)
+
+    def profile(self, steps: int):
+        """
+        Returns (peak velocity, accel time, cruise time, decel time) for a move of steps
+        """
+        revs = abs(steps) / self.steps_per_rev
+        if revs == 0:
+            return 0.0, 0.0, 0.0, 0.0
+        v = self.velocity
+        # revolutions spent getting up to speed and back down
+        ramps = v * v / (2 * self.accel) + v * v / (2 * self.decel)
+        if revs >= ramps:
+            return v, v / self.accel, (revs - ramps) / v, v / self.decel
+        peak = math.sqrt(2 * revs * self.accel * self.decel / (self.accel + self.decel))
+        return peak, peak / self.accel, 0.0, peak / self.decel
+
+    def ramp_steps(self):
+        """
+        Returns (steps to get up to VE, steps to stop from VE), the run-up
+        and run-out a move needs around a stretch crossed at constant speed
+        """
+        v = self.velocity
+        return v * v / (2 * self.accel) * self.steps_per_rev, v * v / (2 * self.decel) * self.steps_per_rev
+
+    def move_time(self, steps: int) -> float:
+        peak, t_accel, t_cruise, t_decel = self.profile(steps)
+        return t_accel + t_cruise + t_decel
+
+    def move_times(self, steps):
+        """
+        move_time for an array of move lengths at once
+        """
+        revs = np.abs(np.asarray(steps, dtype=np.float64)) / self.steps_per_rev
+        v = self.velocity
+        ramps = v * v / (2 * self.accel) + v * v / (2 * self.decel)
+        full = v / self.accel + v / self.decel + (revs - ramps) / v
+        peak = np.sqrt(2 * revs * self.accel * self.decel / (self.accel + self.decel))
+        return np.where(revs >= ramps, full, peak / self.accel + peak / self.decel)
+
+    def steps_at(self, steps: int, t: float) -> float:
+        """
+        Distance in steps covered t seconds into a move of steps, for
+        telling how far along a move should be
+        """
+        peak, t_accel, t_cruise, t_decel = self.profile(steps)
+        sign = 1 if steps >= 0 else -1
+        if t <= 0:
+            return 0.0
+        if t < t_accel:
+            revs = 0.5 * self.accel * t * t
+        elif t < t_accel + t_cruise:
+            revs = 0.5 * peak * t_accel + peak * (t - t_accel)
+        elif t < t_accel + t_cruise + t_decel:
+            td = t - t_accel - t_cruise
+            revs = 0.5 * peak * t_accel + peak * t_cruise + peak * td - 0.5 * self.decel * td * td
+        else:
+            return float(steps)
+        return sign * revs * self.steps_per_rev
@@ -0,0 +1,88 @@
+import asyncio, threading
+from collections import deque
+import AsyncTransport
+
+
+class MotionJob:
+    def __init__(self, number: int, description: str, make):
+        self.number = number
+        self.description = description
+        # returns the coroutine that does the work
+        self.make = make
+
+    def __str__(self):
+        return "#{} {}".format(self.number, self.description)
+
+
+class MotionQueue:
+    """
+    Moves waiting to run on one axis. put returns at once, the moves run
+    one after the other in a task on the background loop, so the caller
+    is free to command other axes or read status meanwhile.
+    """
+    def __init__(self, control):
+        self.control = control
+        self.pending = deque()
+        self.current = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.next_number = 1
+
+    def put(self, description: str, make) -> MotionJob:
+        """
+        Queues make, a function returning the coroutine to run, e.g.
+        lambda: control.async_move_absolute(30)
+        """
+        with self.lock:
+            job = MotionJob(self.next_number, description, make)
+            self.next_number += 1
+            self.pending.append(job)
+            self.idle.clear()
+            if not self.running:
+                self.running = True
+                asyncio.run_coroutine_threadsafe(self.serve(), AsyncTransport.background_loop())
+        return job
+
+    async def serve(self) -> None:
+        while True:
+            with self.lock:
+                if len(self.pending) == 0:
+                    self.current = None
+                    self.running = False
+                    self.idle.set()
+                    return
+                self.current = self.pending.popleft()
+            try:
+                await self.current.make()
+            except Exception as e:
+                print(f"\n{self.control.name}: {self.current} failed: {e}")
+
+    def busy(self) -> bool:
+        return not self.idle.is_set()
+
+    def jobs(self) -> list:
+        """
+        The running job, if any, followed by the waiting ones
+        """
+        with self.lock:
+            ret = list(self.pending)
+            if self.current is not None:
+                ret.insert(0, self.current)
+            return ret
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until the queue is empty, returns False on timeout
+        """
+        return self.idle.wait(timeout)
+
+    def cancel(self) -> int:
+        """
+        Drops the waiting jobs, the running one finishes. Returns how many were dropped.
+        """
+        with self.lock:
+            count = len(self.pending)
+            self.pending.clear()
+        return count
@@ -0,0 +1,198 @@
+import SCLCommand
+
+# the drive queues buffered commands in a 128 character buffer, a program
+# sent in one write has to fit in it completely, longer ones are streamed
+COMMAND_BUFFER_SIZE = 128
+
+# seconds to allow a program that seeks home, its length depends on where the
+# actuator starts
+HOMING_TIMEOUT = 120.0
+
+
+class QProgram:
+    """
+    A named motion sequence made of buffered SCL commands. The drive runs
+    buffered commands back to back in the order they arrive, so a whole
+    sequence written at once runs with drive timing between its steps, and
+    an SS marker at the end tells the host it is done.
+
+    SCL can't store programs on the drive, so a program is either sent in
+    one write each time it runs (streamed if it is longer than the command
+    buffer), or, on drives that take Q programs, stored once in a Q segment
+    with Q Programmer (compile() gives the text to paste) and bound with
+    segment, after which running it is a single QX command.
+
+    Moves are kept in drive steps. positions() replays them from a start
+    position so the caller can check every point against its limits.
+    """
+    def __init__(self, name: str, segment: int = 0):
+        if not name.isalnum():
+            raise ValueError(f"Program name '{name}' must be letters and digits only")
+        self.name = name
+        self.segment = segment
+        self.commands = []
+        # ("rel", steps), ("abs", position), ("home", None) or ("wait", seconds)
+        self.steps = []
+        self.homes = False
+        self.home_value = 0.0
+
+    def velocity(self, rps: float):
+        self.commands.append("VE{}".format(rps))
+        return self
+
+    def accel(self, rps2: float):
+        self.commands.append("AC{}".format(rps2))
+        return self
+
+    def decel(self, rps2: float):
+        self.commands.append("DE{}".format(rps2))
+        return self
+
+    def move_relative(self, steps: int):
+        self.commands.append("FL{}".format(int(steps)))
+        self.steps.append(("rel", int(steps)))
+        return self
+
+    def move_to(self, position: int):
+        self.commands.append("FP{}".format(int(position)))
+        self.steps.append(("abs", int(position)))
+        return self
+
+    def wait(self, seconds: float):
+        # WT takes .01 - 300 s
+        seconds = min(max(seconds, 0.01), 300.0)
+        self.commands.append("WT{:.2f}".format(seconds))
+        self.steps.append(("wait", seconds))
+        return self
+
+    def output(self, output: int, high: bool):
+        self.commands.append("SO{}{}".format(output, "H" if high else "L"))
+        return self
+
+    def seek_home(self, input: int, condition: str, direction: int, home_value: float):
+        """
+        Seeks the home sensor on input (1-8) for condition (H, L, R or F) in
+        the direction of the sign of direction, then defines that spot as
+        step 0 which the controller takes to be home_value (deg or mm)
+        """
+        self.commands.append("DI{}".format(1 if direction >= 0 else -1))
+        self.commands.append("SH{}{}".format(input, condition))
+        self.commands.append("SP0")
+        self.steps.append(("home", None))
+        self.homes = True
+        self.home_value = home_value
+        return self
+
+    def marker(self) -> str:
+        return "SSQ" + self.name
+
+    def compile(self) -> list:
+        """
+        Returns the buffered commands of the program followed by its completion marker
+        """
+        return self.commands + [self.marker()]
+
+    def size(self, address: str = "") -> int:
+        return sum(len(SCLCommand.encode(address, c)) for c in self.compile())
+
+    def fits(self, address: str = "") -> bool:
+        return self.size(address) <= COMMAND_BUFFER_SIZE
+
+    def positions(self, start: int) -> list:
+        """
+        Returns every position the program moves to starting from start, in
+        order, as (position, homed) pairs. Once the program has sought home
+        positions count from home (step 0) and homed is True.
+        """
+        ret = []
+        pos = start
+        homed = False
+        for kind, value in self.steps:
+            if kind == "rel":
+                pos += value
+            elif kind == "abs":
+                pos = value
+            elif kind == "home":
+                pos = 0
+                homed = True
+            else:
+                continue
+            ret.append((pos, homed))
+        return ret
+
+    def end_position(self, start: int):
+        points = self.positions(start)
+        if len(points) == 0:
+            return start, False
+        return points[-1]
+
+    def estimate_time(self, start: int, steps_to_time) -> float:
+        """
+        Rough running time of the program, steps_to_time converts a move
+        length to seconds. Used to size the wait for the completion marker.
+        """
+        if self.homes:
+            return HOMING_TIMEOUT
+        total = 0.0
+        pos = start
+        for kind, value in self.steps:
+            if kind == "wait":
+                total += value
+                continue
+            target = pos + value if kind == "rel" else value
+            total += steps_to_time(target - pos)
+            pos = target
+        return total
+
+    def __str__(self):
+        if self.segment > 0:
+            where = "Q segment {}".format(self.segment)
+        elif self.fits():
+            where = "buffered"
+        else:
+            where = "streamed"
+        return "{:12s} {:>4d} chars  {:10s}  {}".format(self.name, self.size(), where, ";".join(self.compile()))
+
+
+def scan_pattern(control, name: str, step: float, count: int, dwell: float, velocity: float):
+    """
+    count moves of step (deg or mm) from wherever the actuator is, resting
+    dwell seconds after each one
+    """
+    program = QProgram(name).velocity(velocity)
+    t_steps = control.to_steps(step)
+    for i in range(count):
+        program.move_relative(t_steps).wait(dwell)
+    return program
+
+
+def scan_points(control, name: str, points: list, dwell: float, velocity: float):
+    """
+    Absolute moves to each of points (deg or mm) in order, resting dwell
+    seconds at each
+    """
+    program = QProgram(name).velocity(velocity)
+    for point in points:
+        program.move_to(control.position_of(point)).wait(dwell)
+    return program
+
+
+def toggle(control, name: str, a: float, b: float, dwell: float, cycles: int, velocity: float):
+    """
+    Goes back and forth between the absolute positions a and b (deg or mm),
+    resting dwell seconds at each, e.g. between IN and OUT on a linear actuator
+    """
+    program = QProgram(name).velocity(velocity)
+    pos_a = control.position_of(a)
+    pos_b = control.position_of(b)
+    for i in range(cycles):
+        program.move_to(pos_a).wait(dwell)
+        program.move_to(pos_b).wait(dwell)
+    return program
+
+
+def homing(control, name: str, input: int, condition: str, direction: int, home_value: float, velocity: float):
+    """
+    Seeks the home sensor and makes that spot home_value (deg or mm)
+    """
+    return QProgram(name).velocity(velocity).seek_home(input, condition, direction, home_value)
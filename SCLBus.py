@@ -0,0 +1,370 @@
+import serial, select, time, threading
+from collections import deque
+from contextlib import contextmanager
+import SCLCommand
+import AsyncTransport
+from SCLCommand import SCLError, SCLTimeoutError
+
+# drives always power up at 9600, faster rates are negotiated with BR
+DEFAULT_BAUD_RATE = 9600
+
+# longest a write may wait for room in the driver's transmit buffer, in seconds
+WRITE_TIMEOUT = 1.0
+
+# every serial port in use, shared by all the drives on it
+buses = {}
+
+
+def get_bus(port: str):
+    """
+    Returns the bus for a serial port, opening the port the first time
+    """
+    if port not in buses:
+        buses[port] = SCLBus(port)
+    return buses[port]
+
+
+class SCLBus:
+    """
+    A serial port and the drives on it. A plain RS-232 port is a bus with a
+    single drive and no address. On an RS-485 multi-drop bus every drive has
+    its own address character (set with DA) that prefixes its commands and
+    its replies.
+
+    Only one exchange may be on the wire at a time, so callers take turns.
+    Waiting callers are served round robin by address so a drive that is
+    polled hard (a move loop) can't starve the others, and the next request
+    goes out as soon as the previous reply frame is complete, plus a short
+    turnaround gap for the line to change direction.
+    """
+    def __init__(self, port: str):
+        self.port = port
+        self.rx_buffer = bytearray()
+        self.members = []
+        # seconds of quiet between the end of one exchange and the next request
+        self.turnaround = 0.001
+        self.cond = threading.Condition()
+        self.queues = {}
+        self.order = []
+        self.last = -1
+        self.holder = None
+        self.released_at = 0.0
+        # SS markers awaited without holding the bus, (address, command) ->
+        # the frame that answered it once it has come back, see transact_marked
+        self.markers = {}
+        self.transport = AsyncTransport.AsyncTransport(self)
+        self.open()
+
+    # Initialization parameters. Note the serial port and baud rate of your project
+    # may vary. The drive powers up at 9600, faster rates are set with negotiate_baud
+    def open(self) -> None:
+        ser=serial.Serial()
+        ser.port = self.port
+        ser.baudrate = DEFAULT_BAUD_RATE
+        ser.bytesize = serial.EIGHTBITS
+        ser.parity = serial.PARITY_NONE
+        ser.stopbits = serial.STOPBITS_ONE
+        ser.timeout=1.0
+        ser.xonxoff = False
+        ser.rtscts = False
+        ser.dsrdtr = False
+        # the port is non-blocking once the event loop watches it, with a
+        # zero write timeout a write could then stop short without an error
+        ser.writeTimeout = WRITE_TIMEOUT
+        self.ser = ser
+        try:
+            self.ser.open()
+        except Exception as e:
+            print(f"Failed to initialize serial connection, check that the port '{self.port}' exists and is valid")
+
+    def join(self, control) -> None:
+        if control not in self.members:
+            self.members.append(control)
+
+    def leave(self, control) -> None:
+        if control in self.members:
+            self.members.remove(control)
+
+    def is_multidrop(self) -> bool:
+        return len(self.members) > 1 or any(len(m.address) > 0 for m in self.members)
+
+    def acquire(self, address: str) -> None:
+        """
+        Blocks until it is address's turn on the wire
+        """
+        ticket = object()
+        with self.cond:
+            if address not in self.queues:
+                self.queues[address] = deque()
+                self.order.append(address)
+            self.queues[address].append(ticket)
+            while not (self.holder is None and self.next_address() == address and self.queues[address][0] is ticket):
+                self.cond.wait()
+            self.queues[address].popleft()
+            self.holder = ticket
+            self.last = self.order.index(address)
+        gap = self.turnaround - (time.monotonic() - self.released_at)
+        if gap > 0:
+            time.sleep(gap)
+
+    def try_acquire(self, address: str) -> bool:
+        """
+        Takes the turn if the bus is free and nobody is waiting, without blocking
+        """
+        with self.cond:
+            if self.holder is not None or any(len(q) > 0 for q in self.queues.values()):
+                return False
+            if address not in self.queues:
+                self.queues[address] = deque()
+                self.order.append(address)
+            self.holder = address
+            self.last = self.order.index(address)
+            return True
+
+    def release(self) -> None:
+        with self.cond:
+            self.holder = None
+            self.released_at = time.monotonic()
+            self.cond.notify_all()
+
+    def next_address(self):
+        n = len(self.order)
+        for i in range(1, n + 1):
+            address = self.order[(self.last + i) % n]
+            if len(self.queues[address]) > 0:
+                return address
+        return None
+
+    @contextmanager
+    def turn(self, address: str):
+        self.acquire(address)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def write(self, address: str, command: str) -> None:
+        if self.ser.isOpen():
+            try:
+                self.write_bytes(SCLCommand.encode(address, command))
+            except Exception as e1:
+                print ("Error Communicating...: " + str(e1))
+
+    def write_bytes(self, data: bytes) -> None:
+        """
+        Hands all of data to the port, raises SCLError if it can't
+        """
+        try:
+            written = self.ser.write(data)
+        except serial.SerialTimeoutException:
+            raise SCLError(data.decode(errors="replace").strip(), f"write timed out after {WRITE_TIMEOUT} s")
+        if written != len(data):
+            raise SCLError(data.decode(errors="replace").strip(), f"only {written} of {len(data)} bytes written")
+
+    def send(self, address: str, command: str) -> None:
+        with self.turn(address):
+            self.write(address, command)
+
+    def flush_input(self) -> None:
+        if self.transport.elsewhere():
+            # the loop's reader appends to rx_buffer, only it may clear it
+            return self.transport.call(self.transport.flush_input())
+        self.keep_markers()
+        self.ser.flushInput()
+        self.rx_buffer.clear()
+
+    def note_marker(self, frame: bytes) -> None:
+        """
+        Records frame as the answer to an awaited marker if it is one. Any
+        turn holder may read it, so every frame taken off the port goes
+        through here.
+        """
+        for (address, command), seen in list(self.markers.items()):
+            if seen is None:
+                text = SCLCommand.strip_address(address, frame.decode(errors="replace"))
+                if SCLCommand.lookup(command).matches(command, text):
+                    self.markers[(address, command)] = text
+
+    def keep_markers(self) -> None:
+        """
+        Picks any awaited marker out of the input before it is thrown away
+        """
+        if len(self.markers) == 0:
+            return
+        if self.ser.in_waiting > 0:
+            self.rx_buffer += self.ser.read(self.ser.in_waiting)
+        for frame in self.rx_buffer.split(b"\r")[:-1]:
+            self.note_marker(frame)
+
+    def read_frame(self, timeout: float = None):
+        """
+        Reads one carriage return terminated reply, returning it without the
+        terminator, or None if no complete frame arrived before the timeout
+        (defaults to the port timeout). Returns as soon as the terminator is
+        seen, bytes after it are kept for the next call.
+        """
+        if timeout is None:
+            timeout = self.ser.timeout
+        if self.transport.elsewhere():
+            return self.transport.call(self.transport.read_frame(timeout))
+        deadline = time.monotonic() + timeout
+        while True:
+            end = self.rx_buffer.find(b"\r")
+            if end >= 0:
+                frame = bytes(self.rx_buffer[:end])
+                del self.rx_buffer[:end + 1]
+                self.note_marker(frame)
+                return frame
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # wait for the first byte with select rather than the port
+            # timeout, changing that costs a tcsetattr every time
+            if self.ser.in_waiting == 0:
+                ready, _, _ = select.select([self.ser.fileno()], [], [], remaining)
+                if len(ready) == 0:
+                    return None
+            # then take everything that has arrived
+            chunk = self.ser.read(max(1, self.ser.in_waiting))
+            if len(chunk) == 0:
+                return None
+            self.rx_buffer += chunk
+
+    def wait_reply(self, address: str, command: str, spec, deadline: float, start: float, attempt: int = 1):
+        """
+        Reads frames until one that answers command arrives, skipping any
+        that belong to something else (stale replies, other drives, or our
+        own echo on a two wire bus). Returns None at the deadline.
+        """
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            frame = self.read_frame(remaining)
+            if frame is None:
+                return None
+            text = SCLCommand.strip_address(address, frame.decode(errors="replace"))
+            if spec.accept(command, text):
+                return SCLCommand.SCLReply(command, text, spec.parse(command, text), attempt, time.monotonic() - start)
+
+    def transact(self, address: str, command: str, timeout: float = None, retries: int = None):
+        """
+        Sends a command and pairs it with its reply using the per command
+        reply rules in SCLCommand. Returns an SCLReply, or None for commands
+        that do not answer, which are only written. Raises SCLTimeoutError if
+        no matching reply arrives within the command's timeout after all
+        retries, and SCLNackError if the drive rejects the command.
+        """
+        if self.transport.elsewhere():
+            return self.transport.call(self.transport.transact(address, command, timeout, retries))
+        with self.turn(address):
+            return self.exchange(address, command, timeout, retries)
+
+    def exchange(self, address: str, command: str, timeout: float = None, retries: int = None):
+        """
+        transact without taking a turn, the caller must hold it
+        """
+        spec = SCLCommand.lookup(command)
+        if spec is None or not spec.expects_reply(command):
+            self.write(address, command)
+            if spec is not None and spec.settle > 0:
+                time.sleep(spec.settle)
+            return None
+        if not self.ser.isOpen():
+            raise SCLError(command, "serial port is not open")
+        if timeout is None:
+            timeout = spec.timeout
+        if retries is None:
+            retries = spec.retries
+        start = time.monotonic()
+        for attempt in range(1, retries + 2):
+            # this is stop-and-wait, anything already waiting is stale
+            self.flush_input()
+            self.write(address, command)
+            reply = self.wait_reply(address, command, spec, time.monotonic() + timeout, start, attempt)
+            if reply is not None:
+                return reply
+        raise SCLTimeoutError(command, timeout, retries + 1)
+
+    def transact_batch(self, address: str, commands: list, timeout: float = None) -> list:
+        """
+        Sends a sequence of commands as one buffered write, split where a
+        command needs the line to stay quiet after it or the drive's receive
+        buffer would overflow (see SCLCommand.split_batch), then collects the
+        replies of the commands that answer in a single read pass. Returns a
+        list holding an SCLReply, or None for commands that do not answer, for
+        each command in order. A reply lost inside the batch is retried on
+        its own. timeout, if given, replaces the reply timeout of every
+        command. The reply of a marker awaited with transact_marked is left
+        to it.
+        """
+        if len(commands) == 0:
+            return []
+        if not self.ser.isOpen():
+            raise SCLError(";".join(commands), "serial port is not open")
+        if self.transport.elsewhere():
+            return self.transport.call(self.transport.transact_batch(address, commands, timeout))
+        with self.turn(address):
+            specs = [SCLCommand.lookup(c) for c in commands]
+            answering = [spec is not None and spec.expects_reply(c) and (address, c) not in self.markers
+                for c, spec in zip(commands, specs)]
+            if any(answering):
+                self.flush_input()
+            start = time.monotonic()
+            nbytes = 0
+            writes = SCLCommand.split_batch(address, commands)
+            for i, (chunk, settle) in enumerate(writes):
+                self.write_bytes(chunk)
+                nbytes += len(chunk)
+                if i < len(writes) - 1:
+                    # let it clear the wire so the receive buffer never holds more than one write
+                    settle = max(settle, len(chunk) * 10.0 / self.ser.baudrate)
+                if settle > 0:
+                    time.sleep(settle)
+            # replies can't start before the whole batch is on the wire, 10 bits per character
+            wire_time = nbytes * 10.0 / self.ser.baudrate
+            results = []
+            for command, spec, answers in zip(commands, specs, answering):
+                if not answers:
+                    results.append(None)
+                    continue
+                reply_timeout = spec.timeout if timeout is None else timeout
+                reply = self.wait_reply(address, command, spec, time.monotonic() + reply_timeout + wire_time, start)
+                wire_time = 0
+                if reply is None:
+                    reply = self.exchange(address, command, timeout)
+                results.append(reply)
+            return results
+
+    def transact_marked(self, address: str, commands: list, timeout: float) -> list:
+        """
+        Runs a batch that ends in an SS marker, which only comes back once
+        every command before it has run, like a buffered program. The batch
+        is written in one turn as with transact_batch, then the bus is
+        released and the marker is looked for every MARKER_POLL seconds, up
+        to timeout, so the other drives on the bus are served while the
+        program runs. Returns the replies as transact_batch does, the
+        marker's last, and raises SCLTimeoutError if it doesn't come back.
+        """
+        if not self.ser.isOpen():
+            raise SCLError(";".join(commands), "serial port is not open")
+        if self.transport.elsewhere():
+            return self.transport.call(self.transport.transact_marked(address, commands, timeout))
+        marker = commands[-1]
+        self.markers[(address, marker)] = None
+        try:
+            results = self.transact_batch(address, commands)
+            start = time.monotonic()
+            while self.markers[(address, marker)] is None:
+                if time.monotonic() - start > timeout:
+                    raise SCLTimeoutError(marker, timeout, 1)
+                time.sleep(AsyncTransport.MARKER_POLL)
+                # whatever has arrived, read_frame notes the marker
+                with self.turn(address):
+                    while self.read_frame(0.001) is not None:
+                        pass
+            text = self.markers[(address, marker)]
+        finally:
+            del self.markers[(address, marker)]
+        results[-1] = SCLCommand.SCLReply(marker, text, text, 1, time.monotonic() - start)
+        return results
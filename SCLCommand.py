@@ -0,0 +1,210 @@
+from SCLResponse import parse_int, parse_float, parse_hex32, parse_status, parse_alarm
+
+
+class SCLError(Exception):
+    """
+    Base class for errors in a request/response exchange with a drive
+    """
+    def __init__(self, command: str, message: str):
+        super().__init__(f"{command}: {message}")
+        self.command = command
+
+
+class SCLTimeoutError(SCLError):
+    """
+    The drive did not answer a command that expects a reply in time
+    """
+    def __init__(self, command: str, timeout: float, attempts: int):
+        super().__init__(command, f"no reply after {attempts} attempt(s) of {timeout:.3f} s")
+        self.timeout = timeout
+        self.attempts = attempts
+
+
+class SCLNackError(SCLError):
+    """
+    The drive answered with '?', it did not understand or could not run the command
+    """
+    def __init__(self, command: str, frame: str):
+        super().__init__(command, f"drive rejected command with '{frame}'")
+        self.frame = frame
+
+
+class SCLCommand:
+    """
+    Describes how the drive answers an SCL command.
+
+    reply is one of
+        "none"     : never answers, e.g. FL, ME, PM2
+        "always"   : immediate request, always answers "XX=value", e.g. SC, IP
+        "register" : answers "XX=value" only when sent without a parameter, e.g. VE, SP
+        "echo"     : answers with its own parameter, e.g. SSFOO answers FOO
+
+    settle is how long the host must stay quiet after sending the command
+    before anything else may follow it.
+    """
+    def __init__(self,
+        code: str,
+        reply: str = "none",
+        timeout: float = 0.25,
+        retries: int = 1,
+        parser = None,
+        settle: float = 0.0):
+        self.code    = code
+        self.reply   = reply
+        self.timeout = timeout
+        self.retries = retries
+        self.parser  = parser
+        self.settle  = settle
+
+    def expects_reply(self, command: str) -> bool:
+        if self.reply == "always" or self.reply == "echo":
+            return True
+        if self.reply == "register":
+            return len(command) == len(self.code)
+        return False
+
+    def matches(self, command: str, frame: str) -> bool:
+        """
+        Checks that a reply frame belongs to this command, so that stale
+        replies left over from earlier exchanges are not paired with it
+        """
+        if self.reply == "echo":
+            return frame == command[len(self.code):]
+        return frame.startswith(self.code + "=")
+
+    def accept(self, command: str, frame: str) -> bool:
+        """
+        Returns True if frame is the reply to command, False if it belongs to
+        something else, and raises SCLNackError if the drive rejected it
+        """
+        if frame.startswith("?"):
+            raise SCLNackError(command, frame)
+        return self.matches(command, frame)
+
+    def parse(self, command: str, frame: str):
+        if self.reply == "echo":
+            return frame
+        value = frame[len(self.code) + 1:].strip()
+        if self.parser is None:
+            return value
+        try:
+            return self.parser(value)
+        except ValueError:
+            raise SCLError(command, f"unexpected reply '{frame}'")
+
+
+class SCLReply:
+    """
+    The correlated result of one request/response exchange
+    """
+    def __init__(self, command: str, frame: str, value, attempts: int, elapsed: float):
+        self.command  = command
+        self.frame    = frame
+        self.value    = value
+        self.attempts = attempts
+        self.elapsed  = elapsed
+
+    def __repr__(self):
+        return f"SCLReply({self.command!r}, {self.frame!r}, attempts={self.attempts}, elapsed={self.elapsed:.4f})"
+
+
+# Per command reply behaviour, timeouts and retries. Immediate requests are
+# answered within a few character times so they can fail fast, buffered ones
+# like SS only answer once the commands queued ahead of them are done.
+COMMANDS = {}
+for _cmd in [
+    SCLCommand("SC", "always",   0.1,  2, parse_status),
+    SCLCommand("AL", "always",   0.1,  2, parse_alarm),
+    SCLCommand("IS", "always",   0.1,  2),
+    SCLCommand("BS", "always",   0.1,  2, parse_int),
+    SCLCommand("RS", "always",   0.1,  2),
+    SCLCommand("RV", "always",   0.1,  2),
+    SCLCommand("IA", "always",   0.1,  2),
+    SCLCommand("IP", "always",   0.1,  2, parse_hex32),
+    SCLCommand("IE", "always",   0.1,  2, parse_hex32),
+    SCLCommand("ID", "always",   0.1,  2, parse_hex32),
+    SCLCommand("SP", "register", 0.25, 1, parse_int),
+    SCLCommand("EP", "register", 0.25, 1, parse_int),
+    SCLCommand("DI", "register", 0.25, 1, parse_int),
+    SCLCommand("VE", "register", 0.25, 1, parse_float),
+    SCLCommand("VC", "register", 0.25, 1, parse_float),
+    SCLCommand("AC", "register", 0.25, 1, parse_float),
+    SCLCommand("AM", "register", 0.25, 1, parse_float),
+    SCLCommand("DE", "register", 0.25, 1, parse_float),
+    SCLCommand("JA", "register", 0.25, 1, parse_float),
+    SCLCommand("JS", "register", 0.25, 1, parse_float),
+    SCLCommand("CC", "register", 0.25, 1, parse_float),
+    SCLCommand("CI", "register", 0.25, 1, parse_float),
+    SCLCommand("MR", "register", 0.25, 1, parse_int),
+    SCLCommand("BR", "register", 0.25, 1, parse_int),
+    SCLCommand("PM", "register", 0.25, 1, parse_int),
+    SCLCommand("PR", "register", 0.25, 1, parse_int),
+    SCLCommand("SS", "echo",     1.0,  0),
+    # the manual asks for 50 ms of silence after these, or the receive buffer may overflow
+    SCLCommand("FS", settle=0.05),
+    SCLCommand("FD", settle=0.05),
+    SCLCommand("FC", settle=0.05),
+    SCLCommand("FY", settle=0.05),
+    SCLCommand("SH", settle=0.05),
+    SCLCommand("SK", settle=0.05),
+    SCLCommand("ST", settle=0.05),
+    SCLCommand("CJ", settle=0.05),
+    # saving to flash keeps the drive from servicing its receive buffer for a while
+    SCLCommand("SA", settle=0.1),
+]:
+    COMMANDS[_cmd.code] = _cmd
+
+
+# commands land in a 32 character receive buffer first, a longer write can
+# overflow it while the drive is busy
+RECEIVE_BUFFER_SIZE = 32
+
+# address characters an RS-485 drive can be given with DA
+ADDRESSES = "!\"#$%&'()*+,-./0123456789:;<>?@"
+
+
+def encode(address: str, command: str) -> bytes:
+    """
+    Frames a command for the wire, prefixed with the drive address on a multi-drop bus
+    """
+    return (address + command + "\r").encode()
+
+
+def strip_address(address: str, frame: str) -> str:
+    """
+    Drives on a multi-drop bus prefix their replies with their address
+    """
+    if len(address) > 0 and frame.startswith(address):
+        return frame[len(address):]
+    return frame
+
+
+def lookup(command: str):
+    """
+    Returns the SCLCommand describing command, or None if it is not known
+    """
+    return COMMANDS.get(command[:2])
+
+
+def split_batch(address: str, commands: list) -> list:
+    """
+    Groups the frames of a batch into writes, as (bytes, settle) pairs. A
+    write ends after a command that needs the line quiet, settle is then
+    the pause it needs, and before a frame that would take it past the
+    drive's receive buffer.
+    """
+    writes = []
+    chunk = b""
+    for command in commands:
+        frame = encode(address, command)
+        if len(chunk) > 0 and len(chunk) + len(frame) > RECEIVE_BUFFER_SIZE:
+            writes.append((chunk, 0.0))
+            chunk = b""
+        chunk += frame
+        spec = lookup(command)
+        if spec is not None and spec.settle > 0:
+            writes.append((chunk, spec.settle))
+            chunk = b""
+    if len(chunk) > 0:
+        writes.append((chunk, 0.0))
+    return writes
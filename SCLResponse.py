@@ -0,0 +1,121 @@
+from enum import IntFlag
+
+
+def parse_int(value: str) -> int:
+    return int(value)
+
+
+def parse_float(value: str) -> float:
+    return float(value)
+
+
+def parse_hex32(value: str) -> int:
+    """
+    Immediate commands (IP, IE, ID) answer with a 32 bit two's complement hex value
+    """
+    ret = int(value, 16)
+    if ret & 0x80000000:
+        ret -= 0x100000000
+    return ret
+
+
+class StatusWord(IntFlag):
+    """
+    The drive status word that SC answers with, as hex digits
+    """
+    ENABLED          = 1 << 0
+    SAMPLING         = 1 << 1
+    FAULT            = 1 << 2
+    IN_POSITION      = 1 << 3
+    MOVING           = 1 << 4
+    JOGGING          = 1 << 5
+    STOPPING         = 1 << 6
+    WAITING          = 1 << 7
+    SAVING           = 1 << 8
+    ALARM            = 1 << 9
+    HOMING           = 1 << 10
+    WAITING_TIME     = 1 << 11
+    WIZARD           = 1 << 12
+    CHECKING_ENCODER = 1 << 13
+    Q_RUNNING        = 1 << 14
+    INITIALIZING     = 1 << 15
+
+
+class AlarmWord(IntFlag):
+    """
+    The drive alarm code that AL answers with, as hex digits
+    """
+    POSITION_LIMIT   = 1 << 0
+    CCW_LIMIT        = 1 << 1
+    CW_LIMIT         = 1 << 2
+    OVER_TEMP        = 1 << 3
+    INTERNAL_VOLTAGE = 1 << 4
+    OVER_VOLTAGE     = 1 << 5
+    UNDER_VOLTAGE    = 1 << 6
+    OVER_CURRENT     = 1 << 7
+    OPEN_WINDING     = 1 << 8
+    BAD_ENCODER      = 1 << 9
+    COMM_ERROR       = 1 << 10
+    BAD_FLASH        = 1 << 11
+    NO_MOVE          = 1 << 12
+    BLANK_Q_SEGMENT  = 1 << 14
+
+
+# human readable text for every bit, bit 0 first
+STATUS_TEXT = [
+    (StatusWord.ENABLED,          "Motor Enabled and in position"),
+    (StatusWord.SAMPLING,         "Sampling"),
+    (StatusWord.FAULT,            "Drive Fault (check Alarm Code)"),
+    (StatusWord.IN_POSITION,      "In Position, only valid on servo and StepSERVO drives"),
+    (StatusWord.MOVING,           "Moving"),
+    (StatusWord.JOGGING,          "Jogging"),
+    (StatusWord.STOPPING,         "Stopping"),
+    (StatusWord.WAITING,          "Waiting"),
+    (StatusWord.SAVING,           "Saving"),
+    (StatusWord.ALARM,            "Alarm present (check Alarm Code)"),
+    (StatusWord.HOMING,           "Homing"),
+    (StatusWord.WAITING_TIME,     "Waiting"),
+    (StatusWord.WIZARD,           "Wizard running"),
+    (StatusWord.CHECKING_ENCODER, "Checking encoder"),
+    (StatusWord.Q_RUNNING,        "Q Program is running"),
+    (StatusWord.INITIALIZING,     "Initializing"),
+]
+
+ALARM_TEXT = [
+    (AlarmWord.POSITION_LIMIT,   "Position Limit"),
+    (AlarmWord.CCW_LIMIT,        "CCW Limit"),
+    (AlarmWord.CW_LIMIT,         "CW Limit"),
+    (AlarmWord.OVER_TEMP,        "Over Temp"),
+    (AlarmWord.INTERNAL_VOLTAGE, "Internal Voltage"),
+    (AlarmWord.OVER_VOLTAGE,     "Over Voltage"),
+    (AlarmWord.UNDER_VOLTAGE,    "Under Voltage"),
+    (AlarmWord.OVER_CURRENT,     "Over Current"),
+    (AlarmWord.OPEN_WINDING,     "Open Motor Winding"),
+    (AlarmWord.BAD_ENCODER,      "Bad Encoder"),
+    (AlarmWord.COMM_ERROR,       "Comm Error"),
+    (AlarmWord.BAD_FLASH,        "Bad Flash"),
+    (AlarmWord.NO_MOVE,          "No Move"),
+    (AlarmWord.BLANK_Q_SEGMENT,  "Blank Q Segment"),
+]
+
+
+def parse_status(value: str) -> StatusWord:
+    return StatusWord(int(value, 16) & 0xFFFF)
+
+
+def parse_alarm(value: str) -> AlarmWord:
+    return AlarmWord(int(value, 16) & 0xFFFF)
+
+
+def describe(word, table: list) -> list:
+    """
+    Returns the text of every bit set in word, bit 0 first
+    """
+    return [text for bit, text in table if word & bit]
+
+
+def bits(word) -> str:
+    """
+    word as 16 binary digits, bit 15 first
+    """
+    return format(int(word), "016b")
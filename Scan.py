@@ -0,0 +1,298 @@
+import asyncio, time
+import numpy as np
+import AsyncTransport
+import GroupMove
+import MotionModel
+import ScanOrder
+
+
+def scan_range(start: float, stop: float, step: float) -> list:
+    """
+    start, start + step, ... up to and including stop, in either direction.
+    Computed from the index so rounding doesn't add up along the range.
+    """
+    if step <= 0:
+        raise ValueError("Step must be positive!")
+    count = int(abs(stop - start) / step + 1e-9) + 1
+    sign = 1 if stop >= start else -1
+    return [start + sign * i * step for i in range(count)]
+
+
+class ScanPoint:
+    def __init__(self, target: float):
+        self.target = target
+        # where the axis ended up after rounding to whole steps
+        self.actual = None
+        # time.time() the axis stopped at the point and left it again
+        self.arrival = None
+        self.departure = None
+        self.valid = False
+
+
+class StepScan:
+    """
+    Step-and-dwell scan of one axis over a list of points (deg or mm).
+    At each point the axis stops, callback(index, point) runs if given,
+    and the axis rests until dwell seconds after it arrived, or until the
+    callback returns if that takes longer. The next move goes out right
+    then. Every point is checked against the limits before the scan
+    starts and the drive position is checked after every move, a point
+    that fails the check ends the scan.
+    """
+    def __init__(self, control, points: list, dwell: float, callback = None):
+        self.control = control
+        self.points = [ScanPoint(p) for p in points]
+        self.dwell = dwell
+        self.callback = callback
+        self.start = None
+        self.end = None
+
+    def check(self) -> bool:
+        for point in self.points:
+            if not self.control.in_valid_range(point.target):
+                print("Scan would put it out of range! Limits: ({}, {}), Given:{}".format(self.control.lowerLimit, self.control.upperLimit, point.target))
+                return False
+        return True
+
+    async def async_run(self) -> bool:
+        if len(self.points) == 0 or not self.check():
+            print("Scan not executed!")
+            return False
+        loop = asyncio.get_running_loop()
+        self.start = time.time()
+        done = 0
+        for i, point in enumerate(self.points):
+            point.valid = await self.step_to(point.target)
+            point.arrival = time.time()
+            point.actual = self.actual()
+            if not point.valid:
+                print(f"\nScan stopped at point {i}, position check failed!")
+                point.departure = point.arrival
+                break
+            if self.callback is not None:
+                await loop.run_in_executor(None, self.callback, i, point)
+            rest = point.arrival + self.dwell - time.time()
+            if rest > 0:
+                await asyncio.sleep(rest)
+            point.departure = time.time()
+            done += 1
+            print("\r{} point {}/{} at {}".format(self.label(), done, len(self.points), self.format(point.actual)), end="", flush=True)
+        self.end = time.time()
+        print("")
+        print("Scan of {} points took {:.1f} s, {:.1f} points per minute".format(done, self.end - self.start, self.points_per_minute()))
+        return done == len(self.points)
+
+    def run(self) -> bool:
+        return AsyncTransport.run(self.async_run())
+
+    async def step_to(self, target) -> bool:
+        return await self.control.async_step_to(target)
+
+    def actual(self):
+        return self.control.get_target()
+
+    def label(self) -> str:
+        return self.control.name
+
+    @staticmethod
+    def format(value) -> str:
+        return "{:.5f}".format(value)
+
+    def points_per_minute(self) -> float:
+        done = [p for p in self.points if p.departure is not None and p.valid]
+        if self.start is None or self.end is None or self.end <= self.start:
+            return 0.0
+        return 60.0 * len(done) / (self.end - self.start)
+
+    def save(self, file_name: str) -> None:
+        with open(file_name, "w") as fp:
+            fp.write("# target ({0}), actual ({0}), arrival(s), departure(s), valid\n".format(self.label()))
+            for p in self.points:
+                if p.arrival is None:
+                    continue
+                fp.write("{}, {}, {:.6f}, {:.6f}, {}\n".format(self.format(p.target), self.format(p.actual), p.arrival, p.departure, int(p.valid)))
+
+
+class GroupStepScan(StepScan):
+    """
+    StepScan of several axes at once, each point a value (deg or mm) per
+    axis in controls. The axes move to a point at the same time and the
+    point is reached once the slowest of them stops.
+    """
+    def __init__(self, controls: list, points: list, dwell: float, callback = None):
+        super().__init__(controls[0], [tuple(p) for p in points], dwell, callback)
+        self.controls = controls
+
+    def check(self) -> bool:
+        return all(GroupMove.check_group(list(zip(self.controls, point.target))) for point in self.points)
+
+    async def step_to(self, target) -> bool:
+        results = await asyncio.gather(*[control.async_step_to(value) for control, value in zip(self.controls, target)])
+        return all(results)
+
+    def actual(self):
+        return tuple(control.get_target() for control in self.controls)
+
+    def label(self) -> str:
+        return ", ".join(control.name for control in self.controls)
+
+    @staticmethod
+    def format(value) -> str:
+        return ", ".join("{:.5f}".format(v) for v in value)
+
+
+def group_step_scan(controls: list, points: list, dwell: float, callback = None, optimize: bool = False) -> GroupStepScan:
+    """
+    Step-and-dwell scan of several axes over points, each a value per axis
+    in controls, see GroupStepScan. With optimize the points are visited
+    in the quickest order found by ScanOrder.optimize rather than as given.
+    Returns the scan with its arrival and departure times filled in.
+    """
+    if optimize:
+        ordered = ScanOrder.optimize(controls, points)
+        if ordered is not None:
+            points = ordered
+    scan = GroupStepScan(controls, points, dwell, callback)
+    scan.run()
+    return scan
+
+
+class ContinuousScan:
+    """
+    Constant speed scan of one axis from start to stop (deg or mm) at
+    speed (deg/s or mm/s). The axis first goes back far enough to be up
+    to speed when it crosses start and runs on past stop while it slows
+    down, and its position (IP) is read the whole way, as fast as the
+    bus allows or rate times a second, each reading timestamped. Detector
+    data can then be binned by position afterwards. Run-up and run-out
+    are cut short at the software limits, the ends of the range are then
+    crossed while speeding up or slowing down.
+    """
+    def __init__(self, control, start: float, stop: float, speed: float, rate: float = None):
+        self.control = control
+        self.start = start
+        self.stop = stop
+        self.speed = abs(speed)
+        self.rate = rate
+        # time.time() of every reading and the drive position it returned
+        self.times = []
+        self.steps = []
+        # drive position (steps) and target (deg or mm) the samples are relative to
+        self.origin = None
+        self.origin_value = None
+
+    def velocity(self) -> float:
+        """
+        The scan speed in rev/sec for VE, to the 4 decimals the drive takes
+        """
+        per_rev = abs(self.control.from_steps(self.control.stepsPerRot))
+        return round(self.speed / per_rev, 4)
+
+    def model(self) -> MotionModel.MotionModel:
+        control = self.control
+        return MotionModel.MotionModel(control.accel, control.decel, self.velocity(), control.stepsPerRot)
+
+    def ends(self):
+        """
+        Returns where the axis starts and stops moving (deg or mm), the
+        range plus run-up and run-out with a 10% margin, within the limits
+        """
+        control = self.control
+        sign = 1 if self.stop >= self.start else -1
+        up, down = self.model().ramp_steps()
+        begin = self.start - sign * 1.1 * control.from_steps(up)
+        end = self.stop + sign * 1.1 * control.from_steps(down)
+        low, high = control.lowerLimit, control.upperLimit
+        clipped = (min(high, max(low, begin)), min(high, max(low, end)))
+        if clipped != (begin, end):
+            print("Run-up or run-out cut short at the limits, the ends of the range are not crossed at constant speed")
+        return clipped
+
+    async def async_run(self) -> bool:
+        control = self.control
+        for value in (self.start, self.stop):
+            if not control.in_valid_range(value):
+                print("Scan would put it out of range! Limits: ({}, {}), Given:{}".format(control.lowerLimit, control.upperLimit, value))
+                print("Scan not executed!")
+                return False
+        velocity = self.velocity()
+        if velocity < control.min_velocity:
+            print(f"Speed too low, the drive's slowest is {control.min_velocity} rev/sec!")
+            return False
+        if velocity > control.max_velocity:
+            print(f"Speed too high, the drive's fastest is {control.max_velocity} rev/sec!")
+            return False
+        begin, end = self.ends()
+        if not await control.async_step_to(begin):
+            print("Scan not executed!")
+            return False
+
+        self.origin = control.targetedPosition
+        self.origin_value = control.get_target()
+        final = control.position_of(end)
+        t_steps = final - control.targetedPosition
+        expected = self.model().move_time(t_steps)
+        self.times = []
+        self.steps = []
+        print("Scanning from {:.5f} to {:.5f} at {:.5f}/s...".format(self.start, self.stop, self.speed), end="", flush=True)
+        await control.async_transact_batch(control.register_commands({"VE": velocity}) + ['FL{}'.format(t_steps)])
+        control.note_registers({"VE": velocity})
+        control.set_target(control.value_of(final), final)
+        control.previous_move = t_steps
+
+        deadline = time.monotonic() + 1.5 * expected + 2.0
+        while True:
+            t = time.time()
+            position = await control.async_query("IP")
+            self.times.append(t)
+            self.steps.append(position)
+            if position == final:
+                break
+            if time.monotonic() > deadline:
+                print(f" still moving after {1.5 * expected + 2.0:.1f} s!", end="")
+                break
+            if self.rate is not None:
+                await asyncio.sleep(max(0.0, t + 1.0 / self.rate - time.time()))
+        await control.async_wait_for_move(0.0, False)
+        control.make_log_entry()
+        print(" Scan Finished")
+        self.report()
+        return await control.async_validate_position()
+
+    def run(self) -> bool:
+        return AsyncTransport.run(self.async_run())
+
+    def positions(self):
+        """
+        The readings in deg or mm, as a NumPy array
+        """
+        steps = np.array(self.steps, dtype=np.int64)
+        if self.control.calibration is not None:
+            return self.control.value_of(steps)
+        return self.origin_value + self.control.from_steps(steps - self.origin)
+
+    def report(self) -> None:
+        if len(self.times) < 2:
+            return
+        times = np.array(self.times)
+        values = self.positions()
+        low, high = min(self.start, self.stop), max(self.start, self.stop)
+        inside = times[(values >= low) & (values <= high)]
+        rate = (len(times) - 1) / (times[-1] - times[0])
+        crossed = inside[-1] - inside[0] if len(inside) > 1 else 0.0
+        print("{} readings at {:.1f}/s, range crossed in {:.2f} s".format(len(times), rate, crossed))
+
+    def save(self, file_name: str) -> None:
+        """
+        Writes time, drive position and position in deg or mm of every
+        reading, as NumPy arrays if file_name ends in .npz, otherwise as
+        comma separated text
+        """
+        times = np.array(self.times)
+        steps = np.array(self.steps, dtype=np.int64)
+        values = self.positions()
+        if file_name.endswith(".npz"):
+            np.savez(file_name, time=times, steps=steps, position=values)
+            return
+        np.savetxt(file_name, np.column_stack([times, steps, values]), fmt=["%.6f", "%d", "%.5f"],
+            delimiter=", ", header="time(s), position(steps), position(deg or mm)")
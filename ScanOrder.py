@@ -0,0 +1,177 @@
+import numpy as np
+
+# above this many points nearest_neighbor takes too long to be worth it
+MAX_NEIGHBOR_POINTS = 5000
+# above this many points two_opt, and the time matrix it needs, take too long to be worth it
+MAX_TWO_OPT_POINTS = 400
+
+
+def as_table(points, axes: int):
+    """
+    points as an (n, axes) array, one row per point, single axis points may be plain numbers
+    """
+    table = np.asarray(points, dtype=np.float64)
+    return table.reshape(len(table), axes)
+
+
+def check_points(controls: list, table) -> bool:
+    """
+    Checks every coordinate of every point against its axis' software limits
+    """
+    for axis, control in enumerate(controls):
+        for value in table[:, axis]:
+            if not control.in_valid_range(value):
+                print("Point would put {} out of range! Limits: ({}, {}), Given:{}".format(control.name, control.lowerLimit, control.upperLimit, value))
+                return False
+    return True
+
+
+def drive_positions(controls: list, table):
+    """
+    Drive positions of the points, an (n, axes) array, with the axes' current
+    positions added as row 0 so paths start from where the axes are
+    """
+    columns = [np.concatenate([[control.targetedPosition], control.plan_moves(table[:, axis])[0]])
+        for axis, control in enumerate(controls)]
+    return np.column_stack(columns)
+
+
+def times_from(controls: list, positions, row: int):
+    """
+    Predicted time of the move from one row of positions to every row
+    """
+    times = np.zeros(len(positions))
+    for axis, control in enumerate(controls):
+        column = positions[:, axis]
+        times = np.maximum(times, control.motion_model().move_times(column - column[row]))
+    return times
+
+
+def time_matrix(controls: list, positions):
+    """
+    Predicted time of the move between every pair of rows of positions,
+    the axes move together so a move takes as long as its slowest axis
+    """
+    times = np.zeros((len(positions), len(positions)))
+    for axis, control in enumerate(controls):
+        column = positions[:, axis]
+        times = np.maximum(times, control.motion_model().move_times(column[:, None] - column[None, :]))
+    return times
+
+
+def path_time(controls: list, positions, order) -> float:
+    """
+    Predicted time to visit the points in order (indices into the points)
+    starting from where the axes are
+    """
+    path = positions[np.concatenate([[0], np.asarray(order) + 1])]
+    moves = np.diff(path, axis=0)
+    times = np.zeros(len(moves))
+    for axis, control in enumerate(controls):
+        times = np.maximum(times, control.motion_model().move_times(moves[:, axis]))
+    return float(times.sum())
+
+
+def sweep_orders(table) -> list:
+    """
+    Low to high and high to low along the first axis, which for a single
+    axis is the best order starting from one end or the other
+    """
+    order = np.argsort(table[:, 0], kind="stable")
+    return [order, order[::-1]]
+
+
+def serpentine_orders(table) -> list:
+    """
+    Rows of equal first axis value in first axis order, each row run along
+    the second axis in the opposite direction to the last, for points on a
+    grid. Starts from each of the four corners.
+    """
+    rows = np.unique(table[:, 0])
+    orders = []
+    for first in (rows, rows[::-1]):
+        for flip in (False, True):
+            order = []
+            for i, value in enumerate(first):
+                row = np.nonzero(table[:, 0] == value)[0]
+                row = row[np.argsort(table[row, 1], kind="stable")]
+                if (i % 2 == 1) != flip:
+                    row = row[::-1]
+                order.extend(row)
+            orders.append(np.array(order))
+    return orders
+
+
+def nearest_neighbor(controls: list, positions) -> np.ndarray:
+    """
+    From the start (row 0) always on to the quickest to reach point not
+    visited yet. Times are worked out one row at a time, so memory only
+    grows with the number of points.
+    """
+    n = len(positions) - 1
+    visited = np.zeros(n + 1, dtype=bool)
+    visited[0] = True
+    current = 0
+    order = []
+    for i in range(n):
+        candidates = np.where(visited, np.inf, times_from(controls, positions, current))
+        current = int(np.argmin(candidates))
+        visited[current] = True
+        order.append(current - 1)
+    return np.array(order)
+
+
+def two_opt(times, order) -> np.ndarray:
+    """
+    Reverses stretches of the path while that shortens it. The path starts
+    at row 0 and its end is free.
+    """
+    path = np.concatenate([[0], np.asarray(order) + 1])
+    n = len(path)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = path[i - 1], path[i]
+            c = path[i + 1:]
+            # reversing path[i..j] joins a to path[j] and path[i] to path[j + 1]
+            after = np.append(path[i + 2:], -1)
+            old = times[a, b] + np.where(after >= 0, times[c, after], 0.0)
+            new = times[a, c] + np.where(after >= 0, times[b, after], 0.0)
+            gain = old - new
+            j = int(np.argmax(gain))
+            if gain[j] > 1e-9:
+                path[i:i + j + 2] = path[i:i + j + 2][::-1]
+                improved = True
+    return path[1:] - 1
+
+
+def optimize(controls: list, points: list):
+    """
+    Finds a quick order to visit points in, each point a value (deg or mm)
+    per axis in controls, or a plain value for a single axis. Tries the
+    given order, sweeps, serpentines for two or more axes and, if there
+    aren't too many points, nearest neighbor improved by two_opt, and
+    keeps whichever visits the points in the least predicted time from
+    where the axes are now. Prints the predicted times before and after.
+    Returns the points in the new order, None if one is out of range.
+    """
+    table = as_table(points, len(controls))
+    if len(table) == 0 or not check_points(controls, table):
+        return None
+    positions = drive_positions(controls, table)
+    candidates = [np.arange(len(table))] + sweep_orders(table)
+    if len(controls) >= 2:
+        candidates += serpentine_orders(table)
+    if len(table) <= MAX_NEIGHBOR_POINTS:
+        order = nearest_neighbor(controls, positions)
+        if len(table) <= MAX_TWO_OPT_POINTS:
+            order = two_opt(time_matrix(controls, positions), order)
+        candidates.append(order)
+    scores = [path_time(controls, positions, order) for order in candidates]
+    best = candidates[int(np.argmin(scores))]
+    print("Predicted time for {} points: {:.2f} s as given, {:.2f} s reordered".format(len(table), scores[0], min(scores)))
+    ordered = table[best]
+    if len(controls) == 1:
+        return [float(v) for v in ordered[:, 0]]
+    return [tuple(float(v) for v in row) for row in ordered]
@@ -5,8 +5,14 @@ from sys import argv
 import WebPower
 import Logger
 import StepperControl
+import SCLCommand
+import QProgram
+import GroupMove
+import Scan
+import Configurations
 from HelpCommand import HelpCommand
 import os
+import re
 import signal
 #Gear ratio 14:1
 
@@ -46,6 +52,12 @@ def load_config(config_file_name, default_profile_values):
         l = fp.readlines()
         # get the name of the fields we want each profile to have
         config_header = [ i.strip() for i in l[0].split() ]
+        # columns are matched to properties by name, so the optional ones can come in any order
+        types = {i[0]: i[2] for i in default_profile_values}
+        for name in config_header:
+            if name not in types:
+                print(f"Unknown column {name} in {config_file_name}!")
+                exit(1)
         # get the names of the profiles
         for i in range(1, len(l)):
             pname = l[i].split()[0]
@@ -55,10 +67,13 @@ def load_config(config_file_name, default_profile_values):
             spl = [k.strip() for k in l[i].split()]
             if l[i][0] == "#": continue
             for j in range(0, len(spl)):
-                profiles[i-1][config_header[j]] = default_profile_values[j][2](spl[j])
+                profiles[i-1][config_header[j]] = types[config_header[j]](spl[j])
     return profiles
 
 
+# properties that may be left out of the config, or left at their default value
+optional_profile_values = ["baud", "addr", "home"]
+
 def validate_profile(profile, default_profile_values):
     for i in range(1, len(default_profile_values)):
         prop            = default_profile_values[i][0]
@@ -73,8 +88,11 @@ def validate_profile(profile, default_profile_values):
         except:
             print(f"Failed to parse default value property {prop} to it's correct type!")
             exit(1)
+        if prop in optional_profile_values:
+            if prop not in profile:
+                continue
         # check for default value
-        if profile[prop] == val:
+        elif profile[prop] == val:
             print(f"Profile {profile_name} has property {prop} with value {val}, the same as default!")
             exit(1)
 
@@ -120,7 +138,12 @@ if __name__ == "__main__":
         ("name", "nobody", str, None, ""), 
         ("port", "/dev/null", str, lambda a: os.path.exists(a), "port not found"), 
         ("power", "-1", int, lambda a: a >= 0 and a < 40, "value out of range"),
-        ("log", "nobody.log", str, None, "")
+        ("log", "nobody.log", str, None, ""),
+        ("baud", "9600", int, lambda a: a in StepperControl.BAUD_RATE_CODES, "unsupported baud rate, use one of 9600, 19200, 38400"),
+        # RS-485 multi-drop address set on the drive with DA, "none" for a drive on its own port
+        ("addr", "none", lambda a: "" if a == "none" else a, lambda a: a == "" or (len(a) == 1 and a in SCLCommand.ADDRESSES), "address must be a single DA address character or none"),
+        # limit switch inputs to home on with the drive's SH, host seeks them from the script
+        ("home", "host", str, lambda a: a == "host" or re.fullmatch("[1-8][HLRF]/[1-8][HLRF]", a) is not None, "home must be host or the low and high limit inputs as <input><H|L|R|F>/<input><H|L|R|F>, e.g. 7F/8F")
     ]
     
     Splash()
@@ -139,6 +162,8 @@ if __name__ == "__main__":
         port          = profile["port"]
         log_name      = "%s/stepper/%s"%(home, profile["log"])
         webpower_port = profile["power"]
+        baudrate      = profile.get("baud", StepperControl.DEFAULT_BAUD_RATE)
+        address       = profile.get("addr", "")
     
         first_boot = False
         # Assume that this is the first boot if the log is empty
@@ -154,9 +179,9 @@ if __name__ == "__main__":
         power   = WebPower.WebPower(log, webpower_port)
         power.CheckStatus()
         if (profile["type"] == "R"):
-            lcontrol = StepperControl.RotationControl(name, logger=log, power=power, port=port)
+            lcontrol = StepperControl.RotationControl(name, logger=log, power=power, port=port, baudrate=baudrate, address=address)
         elif (profile["type"] == "L"):
-            lcontrol = StepperControl.LinearControl(name, logger=log, power=power, port=port)
+            lcontrol = StepperControl.LinearControl(name, logger=log, power=power, port=port, baudrate=baudrate, address=address)
         else:
             print("Invalid config file! Types other than linear (L) or rotational (R) not valid!")
             exit(1)
@@ -170,9 +195,13 @@ if __name__ == "__main__":
         if len(log.log_history) == 0:
             lcontrol.print_log_headers()
 
-        lcontrol.check_connect()
+        lcontrol.negotiate_baud()
         booted = lcontrol.booted
         lcontrol.load_from_log()
+        lcontrol.load_tuning()
+        lcontrol.load_calibration()
+        if profile["type"] == "L":
+            lcontrol.set_home_inputs(profile.get("home", "host"))
         if booted:
             lcontrol.is_motor_on()
 
@@ -180,6 +209,9 @@ if __name__ == "__main__":
 
 
     control = controllers[0]
+    configurations = Configurations.Configurations("%s/stepper/configurations.cfg"%(home))
+    # the last step or continuous scan run, for savescan
+    last_scan = None
     
     def SetPort(in_port: str):
         port = in_port
@@ -236,17 +268,61 @@ if __name__ == "__main__":
         global control
         control.powerOff()
 
+    def Busy(con):
+        # a direct move would run into the queued ones
+        if con.queue.busy():
+            print(f"{con.name} has queued moves running, use enq, or wait/cancel first")
+            return True
+        return False
+
     def MoveRel(ang: float):
         global control
-        control.move_relative(ang)
+        if not Busy(control):
+            control.move_relative(ang)
 
     def MoveAbs(ang: float):
         global control
-        control.move_absolute(ang)
+        if not Busy(control):
+            control.move_absolute(ang)
     
     def Move(target: str):
         global control
-        control.move(target)
+        if not Busy(control):
+            control.move(target)
+
+    def Enqueue(target: str):
+        global control
+        target = ParseTarget(control, target)
+        if target is not None:
+            print(control.enqueue_move(target))
+
+    def EnqueueRel(amt: float):
+        global control
+        print(control.enqueue_move_relative(amt))
+
+    def ListQueue():
+        for con in controllers:
+            jobs = con.queue.jobs()
+            if len(jobs) == 0:
+                print(f"{con.name}: idle")
+                continue
+            print(f"{con.name}: running {jobs[0]}")
+            for job in jobs[1:]:
+                print(f"    waiting {job}")
+
+    def WaitQueue(name: str = ""):
+        global control
+        con = control if name == "" else GetController(name)
+        if con is None:
+            return
+        con.queue.wait()
+        print(f"{con.name} queue done")
+
+    def CancelQueue(name: str = ""):
+        global control
+        con = control if name == "" else GetController(name)
+        if con is not None:
+            con.stop_queue()
 
     def GetPosition():
         global control
@@ -258,10 +334,13 @@ if __name__ == "__main__":
 
     def Cmd(command: str):
         global control
+        # the command may change anything on the drive
+        control.invalidate_cache()
         control.send(command)
 
     def CmdOut(command: str):
         global control
+        control.invalidate_cache()
         control.send_get_out(command)
 
     def GetOutput():
@@ -307,6 +386,232 @@ if __name__ == "__main__":
     def MakeLogEntry():
         global control
         control.make_log_entry()
+
+    def SetPollRate(rate: float):
+        global control
+        if rate <= 0:
+            print("Poll rate must be positive!")
+            return
+        control.max_poll_rate = rate
+
+    def SetTelemetry(rate: float):
+        global control
+        control.set_telemetry(rate)
+
+    def SaveTelemetry(file_name: str):
+        global control
+        if control.telemetry is None or len(control.telemetry) == 0:
+            print("No telemetry recorded, turn it on with telemetry <rate>")
+            return
+        control.telemetry.save(file_name)
+        print(f"Saved {len(control.telemetry)} samples to {file_name}")
+
+    def DefineProgram(make, *args):
+        global control
+        try:
+            control.define_program(make(control, *args, control.velocity))
+        except ValueError as e:
+            print(e)
+
+    def StreamScan(start: float, stop: float, step: float, dwell: float):
+        global control
+        if not Busy(control):
+            control.scan(start, stop, step, dwell)
+
+    def StepScan(start: float, stop: float, step: float, dwell: float):
+        global control, last_scan
+        if Busy(control):
+            return
+        try:
+            points = Scan.scan_range(start, stop, step)
+        except ValueError as e:
+            print(e)
+            return
+        print(f"Step scan of {len(points)} points from {points[0]:.5f} to {points[-1]:.5f}")
+        last_scan = control.step_scan(points, dwell)
+
+    def PointScan(*args):
+        global control, last_scan
+        if len(args) < 2:
+            print("Give a dwell time and at least one point!")
+            return
+        if Busy(control):
+            return
+        try:
+            dwell = float(args[0])
+        except ValueError:
+            print("Invalid dwell time!")
+            return
+        points = [ParseTarget(control, a) for a in args[1:]]
+        if None in points:
+            return
+        last_scan = control.step_scan(points, dwell, optimize=True)
+
+    def ContinuousScan(start: float, stop: float, speed: float):
+        global control, last_scan
+        if not Busy(control):
+            last_scan = control.continuous_scan(start, stop, speed)
+
+    def Tune(low: str, high: str):
+        global control
+        if Busy(control):
+            return
+        low = ParseTarget(control, low)
+        high = ParseTarget(control, high)
+        if low is not None and high is not None:
+            control.tune(low, high)
+
+    def CalPoint(measured: float):
+        global control
+        control.add_calibration_point(measured)
+
+    def CalClear():
+        global control
+        control.clear_calibration()
+        print("Calibration table cleared, conversions are linear again")
+
+    def SaveScan(file_name: str):
+        if last_scan is None:
+            print("No scan run yet!")
+            return
+        last_scan.save(file_name)
+        print(f"Saved the last scan to {file_name}")
+
+    def QScan(name: str, step: float, count: int, dwell: float):
+        DefineProgram(QProgram.scan_pattern, name, step, count, dwell)
+
+    def ParseTarget(con, target: str):
+        try:
+            return con.parse_target(target)
+        except ValueError:
+            print("Invalid argument! IN/OUT (linear only) or position (mm/deg)")
+            return None
+
+    def QToggle(name: str, a: str, b: str, dwell: float, cycles: int):
+        global control
+        a = ParseTarget(control, a)
+        b = ParseTarget(control, b)
+        if a is None or b is None:
+            return
+        DefineProgram(QProgram.toggle, name, a, b, dwell, cycles)
+
+    def GetController(name: str):
+        for i in range(len(controllers)):
+            if (name == controllers[i].name):
+                return controllers[i]
+        print(f"No motor named {name}!")
+        return None
+
+    def GroupTargets(args):
+        if len(args) == 0 or len(args) % 2 != 0:
+            print("Give a motor name and a target for every axis!")
+            return None
+        targets = []
+        for i in range(0, len(args), 2):
+            con = GetController(args[i])
+            if con is None or Busy(con):
+                return None
+            target = ParseTarget(con, args[i + 1])
+            if target is None:
+                return None
+            targets.append((con, target))
+        return targets
+
+    def GroupPointScan(*args):
+        global last_scan
+        if len(args) < 3:
+            print("Give a dwell time, the motors and at least one point!")
+            return
+        try:
+            dwell = float(args[0])
+        except ValueError:
+            print("Invalid dwell time!")
+            return
+        controls = []
+        for name in args[1].split(","):
+            con = GetController(name)
+            if con is None or Busy(con):
+                return
+            controls.append(con)
+        points = []
+        for arg in args[2:]:
+            values = arg.split(",")
+            if len(values) != len(controls):
+                print(f"Point {arg} needs a target for each of the {len(controls)} motors!")
+                return
+            point = [ParseTarget(con, v) for con, v in zip(controls, values)]
+            if None in point:
+                return
+            points.append(point)
+        last_scan = Scan.group_step_scan(controls, points, dwell, optimize=True)
+
+    def GroupMoveAbs(*args):
+        targets = GroupTargets(args)
+        if targets is not None:
+            GroupMove.move_group(targets)
+
+    def GroupMoveSync(*args):
+        targets = GroupTargets(args)
+        if targets is not None:
+            GroupMove.move_group_synchronized(targets)
+
+    def PlanConfiguration(name: str):
+        if name not in configurations.configs:
+            print(f"No configuration named {name}!")
+            return None
+        stages = Configurations.Planner(controllers, configurations.rules).plan(configurations.configs[name])
+        if stages is not None and len(stages) == 0:
+            print(f"Already in configuration {name}")
+        return stages
+
+    def ListConfigurations():
+        configurations.list()
+
+    def SaveConfiguration(*args):
+        if len(args) < 2:
+            print("Give a name and at least one motor!")
+            return
+        pairs = []
+        for name in args[1:]:
+            con = GetController(name)
+            if con is None:
+                return
+            pairs.append((con.name, "{:.5f}".format(con.get_target())))
+        configurations.define(args[0], pairs)
+        print(f"Saved configuration {args[0]} to {configurations.file_name}")
+
+    def ShowPlan(name: str):
+        stages = PlanConfiguration(name)
+        if stages:
+            Configurations.Planner.show(stages)
+            print("Predicted time {:.2f} s".format(Configurations.Planner.predict(stages)))
+
+    def GoToConfiguration(name: str):
+        stages = PlanConfiguration(name)
+        if not stages:
+            return
+        for stage in stages:
+            for con, target in stage:
+                if Busy(con):
+                    return
+        Configurations.Planner.show(stages)
+        Configurations.run_plan(stages)
+
+    def QHome(name: str, input: int, condition: str, direction: int, home: float):
+        DefineProgram(QProgram.homing, name, input, condition, direction, home)
+
+    def QSegment(name: str, segment: int):
+        global control
+        control.bind_program(name, segment)
+
+    def QList():
+        global control
+        control.list_programs()
+
+    def QRun(name: str):
+        global control
+        if not Busy(control):
+            control.run_program(name)
      
 
     def helpme(command: str = ""):
@@ -366,6 +671,36 @@ if __name__ == "__main__":
 
         HelpCommand(["savelog"],MakeLogEntry,[],False,False,"Outputs the current state of the controller to the log.", [],"savelog"),       
         
+        HelpCommand(["scan"],StreamScan,[float, float, float, float],False,False,"Visits every step from start to stop (deg/mm), resting dwell seconds at each point. The points are streamed to the drive and run back to back. Will not move outside the software limits defined for the motor",["Start (float), first point","Stop (float), last point","Step (float), distance between points","Dwell (float), seconds to rest at each point"],"scan 10.0 20.0 0.05 0.5"),
+        HelpCommand(["stepscan"],StepScan,[float, float, float, float],False,False,"Like scan, but every move is sent from here and the time the motor arrived at and left each point is recorded, see savescan. Will not move outside the software limits defined for the motor",["Start (float), first point","Stop (float), last point","Step (float), distance between points","Dwell (float), seconds to rest at each point"],"stepscan 10.0 20.0 0.05 0.5"),
+        HelpCommand(["pscan"],PointScan,[float, str],True,False,"Step scan over a list of points (IN/OUT or mm/deg), visited in the order that takes the least predicted time rather than as given, see savescan. The predicted time as given and reordered is printed. Will not move outside the software limits defined for the motor",["Dwell (float), seconds to rest at each point","Point (str), IN/OUT or position, repeat for more points"],"pscan 0.5 40.0 10.0 30.0 20.0"),
+        HelpCommand(["cscan"],ContinuousScan,[float, float, float],False,False,"Moves through start to stop (deg/mm) at a constant speed, reading the position with a timestamp as often as the serial line allows, see savescan. Backs up first to be at speed at start. Will not move outside the software limits defined for the motor",["Start (float), first point","Stop (float), last point","Speed (float), deg or mm per second"],"cscan 0.0 90.0 5.0"),
+        HelpCommand(["savescan"],SaveScan,[str],False,False,"Saves the last scan: for stepscan the targets, reached positions and arrival and departure times, for cscan the timestamped positions, as comma separated text. A cscan can also be saved as NumPy arrays with a .npz file name.",["File (str), where to save"],"savescan scan.csv"),
+        HelpCommand(["qscan"],QScan,[str, float, int, float],False,False,"Defines a scan program: count moves of step (deg/mm) from wherever the actuator is, resting dwell seconds after each. The whole scan runs on the drive with qrun.",["Name (str), letters and digits","Step (float), deg or mm per move","Count (int), number of moves","Dwell (float), seconds to rest after each move"],"qscan fine 0.5 20 1.0"),
+        HelpCommand(["qtoggle"],QToggle,[str, str, str, float, int],False,False,"Defines a program that goes back and forth between two positions (IN/OUT or mm/deg), resting dwell seconds at each.",["Name (str), letters and digits","A (str), IN/OUT or position","B (str), IN/OUT or position","Dwell (float), seconds to rest at each end","Cycles (int), number of round trips"],"qtoggle inout IN OUT 5.0 3"),
+        HelpCommand(["qhome"],QHome,[str, int, str, int, float],False,True,"Defines a homing program that seeks the home sensor and makes that spot the given position.",["Name (str), letters and digits","Input (int), 1-8","Condition (str), H, L, R (rising) or F (falling)","Direction (int), 1 for cw, -1 for ccw","Home (float), position (deg/mm) of the sensor"],"qhome home 3 F -1 0.0"),
+        HelpCommand(["qseg"],QSegment,[str, int],False,True,"Marks a program as stored in a Q segment of the drive (paste the commands from qlist into Q Programmer), it is then started with QX. 0 sends it with every run again. Q segments need a Q drive.",["Name (str), the program","Segment (int), the Q segment, 0 for none"],"qseg fine 1"),
+        HelpCommand(["qlist"],QList,[],False,False,"Lists the programs defined for this motor with their SCL commands.",[],"qlist"),
+        HelpCommand(["qrun"],QRun,[str],False,False,"Runs a program on the drive after checking every point of it against the software limits.",["Name (str), the program"],"qrun fine"),
+
+        HelpCommand(["setpoll"],SetPollRate,[float],False,True,"Sets the most status polls per second used near the end of a move. Lower values leave more of the serial line to other drives, higher ones notice the end of a move sooner.",["Rate (float), polls per second"],"setpoll 20"),
+        HelpCommand(["telemetry"],SetTelemetry,[float],False,True,"Records position, encoder position and status during moves at the given rate. The newest 4096 samples are kept. 0 turns it off.",["Rate (float), samples per second"],"telemetry 50"),
+        HelpCommand(["savetelemetry"],SaveTelemetry,[str],False,True,"Saves the recorded telemetry, as NumPy arrays for a .npz file name, otherwise as comma separated text.",["File (str), where to save"],"savetelemetry move.csv"),
+        HelpCommand(["gpscan"],GroupPointScan,[float, str, str],True,False,"Step scan of several motors over a list of points, each point a target (IN/OUT or mm/deg) for every motor, separated by commas. The motors move to a point together, and the points are visited in the order that takes the least predicted time, trying serpentine orders for grids, see savescan. The predicted time as given and reordered is printed. Every point is checked against the software limits before anything moves.",["Dwell (float), seconds to rest at each point","Motors (str), motor names separated by commas","Point (str), one target per motor separated by commas, repeat for more points"],"gpscan 0.5 FP2_R1,FP1_R1 10,20 30,20 10,40 30,40"),
+        HelpCommand(["gmove"],GroupMoveAbs,[str, str],True,False,"Moves several motors to absolute positions (IN/OUT or mm/deg) at the same time and waits for all of them. Every target is checked against its motor's software limits before any motor moves.",["Name (str), a motor","Target (str), IN/OUT or position for that motor, repeat name and target for more motors"],"gmove FP2_L1 IN FP2_R1 45.0"),
+        HelpCommand(["gsync"],GroupMoveSync,[str, str],True,False,"Like gmove, but every motor is loaded with its move while paused and all of them are started together, the estimated skew between the first and last CT reaching its drive is printed (worked out from the host's write times, not measured on the drives).",["Name (str), a motor","Target (str), IN/OUT or position for that motor, repeat name and target for more motors"],"gsync FP2_L1 IN FP2_R1 45.0"),
+        HelpCommand(["configs"],ListConfigurations,[],False,False,"Lists the named multi-motor configurations and the collision rules kept in configurations.cfg next to stepper.cfg.",[],"configs"),
+        HelpCommand(["configsave"],SaveConfiguration,[str, str],True,True,"Saves where the given motors are now as a named configuration.",["Name (str), the configuration","Motor (str), a motor, repeat for more motors"],"configsave data FP2_L1 FP2_R1"),
+        HelpCommand(["configplan"],ShowPlan,[str],False,False,"Prints the stages that would bring the motors to a configuration and how long that should take. Motors without a collision rule between them move at the same time.",["Name (str), the configuration"],"configplan data"),
+        HelpCommand(["config"],GoToConfiguration,[str],False,False,"Brings every motor of a configuration to its position, stage by stage as configplan shows, respecting the collision rules and the software limits of every motor.",["Name (str), the configuration"],"config data"),
+        HelpCommand(["enq"],Enqueue,[str],False,False,"Queues a move to an absolute position (IN/OUT or mm/deg) on the current motor and returns at once, queued moves run one after the other in the background.",["Target (str), IN/OUT or position"],"enq 45.0"),
+        HelpCommand(["enqrel"],EnqueueRel,[float],False,False,"Queues a relative move (mm/deg) on the current motor and returns at once.",["Amount (float), distance to move"],"enqrel -5.0"),
+        HelpCommand(["queue"],ListQueue,[],False,False,"Lists the running and waiting moves of every motor.",[],"queue"),
+        HelpCommand(["wait"],WaitQueue,[str],True,False,"Waits until the queued moves of a motor are done.",["Name (str), the motor, defaults to the current one"],"wait FP2_L1"),
+        HelpCommand(["cancel"],CancelQueue,[str],True,False,"Drops the queued moves of a motor and stops the one running, the position it stopped at is read back from the drive.",["Name (str), the motor, defaults to the current one"],"cancel FP2_L1"),
+        HelpCommand(["calpoint"],CalPoint,[float],False,True,"Adds a point to the calibration table of the motor: the position (mm/deg) the actuator was measured at where it is now. With two or more points, moves interpolate between the measured points instead of assuming a perfectly linear drive. The table is kept next to the log.",["Measured (float), the measured position"],"calpoint 45.012"),
+        HelpCommand(["calclear"],CalClear,[],False,True,"Deletes the calibration table of the motor, conversions go back to being linear.",[],"calclear"),
+        HelpCommand(["tune"],Tune,[str, str],False,True,"Moves back and forth between two positions (IN/OUT or mm/deg) at ever higher speeds and ramps, checking the position, alarms and encoder after every move, and keeps 80% of the fastest that worked for this motor. A failed try can cost the motor steps, recalibrate afterwards if in doubt.",["Low (str), IN/OUT or position","High (str), IN/OUT or position"],"tune 10.0 80.0"),
         HelpCommand(["getpower"],GetPower,[],False,True,"Checks whether the webpower switch connection is on", [],"getpower"),
         #HelpCommand("setport",SetPort,[str],False,False,"Sets the port used to connect", )
         #"testfunc":   {"func": testfunc, "args":[str, float, int]}
@@ -396,7 +731,7 @@ if __name__ == "__main__":
                          "stat", 
                          "sstat", 
                          "sw", 
-                         "cd", "boot", "help", "helpadv", "setport", "booted"]
+                         "cd", "boot", "help", "helpadv", "setport", "booted", "qlist", "queue", "configs", "configplan", "config", "configsave"]
         if spl[0] not in nobootallowed and not control.booted:
             print("Please boot!")
             return
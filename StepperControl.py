@@ -1,6 +1,29 @@
-import serial, time
+import serial, time, asyncio, os
+import numpy as np
 import Logger
 import WebPower
+import SCLCommand
+import SCLBus
+import QProgram
+import CommandStream
+import MotionModel
+import Telemetry
+import AsyncTransport
+import MotionQueue
+import Scan
+import Tuning
+import CalibrationTable
+import ScanOrder
+import SCLResponse
+from SCLCommand import SCLError, SCLTimeoutError, SCLNackError
+from SCLResponse import StatusWord
+from SCLBus import DEFAULT_BAUD_RATE
+# host bit rate -> SCL bit rate code for the BR command, the manual only lists BR1 to BR3
+BAUD_RATE_CODES = {
+    9600:   1,
+    19200:  2,
+    38400:  3,
+}
 
 class StepperControl:
     name = "" 
@@ -14,9 +37,34 @@ class StepperControl:
     gear_ratio=1
     port=""
     model_code=""
+    baudrate=DEFAULT_BAUD_RATE
+    address=""
+    bus=None
     accumulated_error = 0
     previous_move     = 0
     targetedPosition=0        
+    rx_buffer=bytearray()
+    # speed in rev/sec that moves and programs run at, and the ramps to it in rev/sec/sec
+    velocity=1
+    accel=10
+    decel=10
+    # slowest and fastest VE in rev/sec the drive takes, .025 to 50 for the Si drives
+    min_velocity=0.025
+    max_velocity=50.0
+    programs={}
+    # most SC queries per second while waiting for a move to finish
+    max_poll_rate=20.0
+    # Telemetry to record moves into, None when off
+    telemetry=None
+    # CalibrationTable position_of and value_of go through, None for a linear axis
+    calibration=None
+    # what we know of the drive's state, see register_commands and invalidate_cache
+    cache_lifetime=30.0
+    registers={}
+    known_position=None
+    position_at=0.0
+    known_status=None
+    status_at=0.0
 
     def __init__(self,
         name: str,
@@ -26,7 +74,9 @@ class StepperControl:
         connect_timeout: float = 2.0, 
         port: str = "/dev/ttyS4",
         gear_ratio: float = 14.0 / 1.0,
-        model_code: str ="ff0716"): 
+        model_code: str ="ff0716",
+        baudrate: int = DEFAULT_BAUD_RATE,
+        address: str = ""): 
         self.name = name
         self.logger = logger
         self.power = power
@@ -38,9 +88,21 @@ class StepperControl:
         self.gear_ratio=gear_ratio
         self.port=port
         self.model_code=model_code
+        self.baudrate=baudrate
+        self.address=address
         self.accumulated_error = 0
         self.previous_move     = 0
         self.targetedPosition=0        
+        self.bus=None
+        self.programs={}
+        self.telemetry=None
+        self.calibration=None
+        self.queue=MotionQueue.MotionQueue(self)
+        self.registers={}
+        self.known_position=None
+        self.position_at=0.0
+        self.known_status=None
+        self.status_at=0.0
         self.motor_init()
         
         
@@ -63,12 +125,14 @@ class StepperControl:
         self.send("00")
         response = self.get_output()
         try:
-            self.send("PR1")
-            ret=self.send_get_out("SSFOO", ret=True)
+            ret=self.transact_batch([self.protocol_command(), "SSFOO"])[1].frame
             if ("FOO" not in ret.strip()):
                 print("Motor did not acknowledge being booted in scl mode!")
                 print(ret)
                 return
+        except SCLError as e:
+            print(f"Motor did not acknowledge being booted in scl mode!\n{e}")
+            return
         except serial.SerialTimeoutException as e:
             print(f"Attempting to get FOO reply from motor threw exception:\n{e}")
             return
@@ -79,32 +143,36 @@ class StepperControl:
             print(f"Unhandled exception!\n{e}")
             return
 
+        # the whole setup goes out as one batch, none of these answer
+        setup = []
         # enable Power Mode 2 to ensure that the motor doesn't auto detect connections
         # as this causes an unclearable alarm state
-        self.send("PM2")
+        setup.append("PM2")
         # removes the hardware drive motion limits, from the factory, the lower and
         # upper values are set to the same thing, and so it causes an alarm when trying to
         # move for the first time
         if (self.actuatorType=="ROT"):
-            self.send("DL3")
+            setup.append("DL3")
         elif (self.actuatorType=="LIN"):
-            self.send("DL2")
+            setup.append("DL2")
         else:
             print("Invalid actuator type for initial boot!")
         # Configure the protocol to make sure that we're not getting ack/nack, etc back
-        # when trying to check for boot
-        self.send("PR1")
+        # when trying to check for boot, on a multi-drop bus replies also carry the address
+        setup.append(self.protocol_command())
         # set to point to point command mode
-        self.send("CM21")
+        setup.append("CM21")
         # set acceleration rate to 10 rev/sec/sec
-        self.send("AC10")
+        setup.append("AC{}".format(self.accel))
         # set deceleration rate to 10 rev/sec/sec
-        self.send("DE10")
+        setup.append("DE{}".format(self.decel))
         # Save all parameters for the next time we turn on the motor
-        self.send("SA")
+        setup.append("SA")
         # set the position that the motor thinks it's at to zero because otherwise we 
         # will trigger errors in the script with movement
-        self.send("SP0")
+        setup.append("SP0")
+        self.transact_batch(setup)
+        self.invalidate_cache()
 
         if not self.check_connect():
             print("Failed to do first boot, please check that\n\tThe controller is powered\n\tThe serial port is correct\n\tThe webpower switch port is correct\n\tThe webpower switch is turned on\n\tThe webpower switch script is configured correctly!")
@@ -113,10 +181,17 @@ class StepperControl:
         self.is_motor_on()
         return True
 
+    def protocol_command(self) -> str:
+        # PR bit 1 is standard SCL, bit 2 always prefixes replies with the drive address
+        if len(self.address) > 0:
+            return "PR3"
+        return "PR1"
+
     def boot(self):
         self.power.PowerOn()
+        self.invalidate_cache()
         time.sleep(3)
-        self.check_connect()
+        self.negotiate_baud()
         self.load_from_log()
         if (self.booted):
             self.is_motor_on()
@@ -124,84 +199,209 @@ class StepperControl:
     def powerOff(self):
        self.power.PowerOff() 
        self.booted = False
+       self.invalidate_cache()
+       # the drive comes back up at the default rate
+       self.set_host_baud(DEFAULT_BAUD_RATE)
         
     def check_connect(self):
         try:
-            ret=self.send_get_out("SSFOO", ret=True)
+            ret=self.query("SSFOO")
             if (ret.strip()=="FOO"):
                 self.booted = True
                 return True
             else:
                 self.booted = False
                 return False
+        except (SCLTimeoutError, SCLNackError):
+            self.booted = False
+            return False
         except:
             self.booted = False
             print(f"Serial connection is not open, check that your port is valid!")
 
-    # Initialization parameters. Note the serial port and baud rate of your project
-    # may vary. Our default baud rate is 9600
-    def motor_init(self) -> None:
-        ser=serial.Serial()
-        ser.port = self.port
-        ser.baudrate = 9600
-        ser.bytesize = serial.EIGHTBITS
-        ser.parity = serial.PARITY_NONE
-        ser.stopbits = serial.STOPBITS_ONE
-        ser.timeout=1.0 
-        ser.xonxoff = False
-        ser.rtscts = False
-        ser.dsrdtr = False
-        ser.writeTimeout = 0
-        self.ser = ser
-        try:
-            self.ser.open()
-        except Exception as e:
-            print(f"Failed to initialize serial connection, check that the port '{self.port}' exists and is valid")
+    def set_host_baud(self, baudrate: int) -> None:
+        """
+        Changes the bit rate of the host side of the link only
+        """
+        if self.ser.isOpen():
+            # let anything still queued leave at the old rate
+            self.ser.flush()
+        self.ser.baudrate = baudrate
+        self.flush_input()
 
-        #self.make_log_entry()
-            
+    def negotiate_baud(self, baudrate: int = None) -> bool:
+        """
+        Moves the link to the profile's bit rate with BR, switches the host
+        port to match and checks the link with the SSFOO echo. If the drive
+        does not answer at the new rate both sides go back to 9600. Also
+        finds a drive that is still at the faster rate from an earlier
+        session, since drives only return to 9600 at power up. Returns True
+        if the link runs at the requested rate.
+        """
+        if baudrate is None:
+            baudrate = self.baudrate
+        if baudrate not in BAUD_RATE_CODES:
+            print(f"Unsupported baud rate {baudrate}, supported rates are {list(BAUD_RATE_CODES.keys())}")
+            baudrate = DEFAULT_BAUD_RATE
+        if self.bus.is_multidrop() and baudrate != self.ser.baudrate:
+            # every drive on the bus would have to switch at the same moment
+            print(f"{self.name} shares {self.port} with other drives, keeping the bus at {self.ser.baudrate} baud")
+            self.check_connect()
+            return False
+
+        if not self.check_connect() and self.ser.baudrate != baudrate:
+            self.set_host_baud(baudrate)
+            if self.check_connect():
+                return True
+            self.set_host_baud(DEFAULT_BAUD_RATE)
+            self.check_connect()
+            return False
+        if not self.booted or self.ser.baudrate == baudrate:
+            return self.booted and self.ser.baudrate == baudrate
+
+        old_rate = self.ser.baudrate
+        self.send("BR{}".format(BAUD_RATE_CODES[baudrate]))
+        self.set_host_baud(baudrate)
+        # give the drive a moment to act on BR before talking at the new rate
+        time.sleep(0.05)
+        if self.check_connect():
+            print(f"Serial link running at {baudrate} baud")
+            return True
+
+        print(f"Drive did not answer at {baudrate} baud, falling back to {DEFAULT_BAUD_RATE}")
+        # in case the drive did switch, ask it to go back at the rate it is on
+        self.send("BR{}".format(BAUD_RATE_CODES[DEFAULT_BAUD_RATE]))
+        self.set_host_baud(DEFAULT_BAUD_RATE)
+        if not self.check_connect() and old_rate != DEFAULT_BAUD_RATE:
+            self.set_host_baud(old_rate)
+            self.check_connect()
+        return False
 
-    # When we send a serial command, the program will check and print
-    # the response given by the drive.
+    def motor_init(self) -> None:
+        """
+        Attaches to the bus for our port, opening the port if no other
+        drive on it has yet
+        """
+        if self.bus is not None:
+            self.bus.leave(self)
+        self.bus = SCLBus.get_bus(self.port)
+        self.bus.join(self)
+        # the port and frame buffer are shared with every drive on the bus
+        self.ser = self.bus.ser
+        self.rx_buffer = self.bus.rx_buffer
+        self.transport = self.bus.transport
+
+    # Writes a command to the drive without waiting for anything back, use
+    # transact/query for commands that answer.
     def send(self, command) -> None:
-        if self.ser.isOpen():
-            try:
-                self.ser.write((command+'\r').encode())
-            except Exception as e1:
-                print ("Error Communicating...: " + str(e1))
-            self.flush_input()
+        self.bus.send(self.address, command)
+
+    def transact(self, command: str, timeout: float = None, retries: int = None):
+        """
+        Sends a command and returns its correlated SCLReply, or None for
+        commands that do not answer. See SCLBus.transact.
+        """
+        return self.bus.transact(self.address, command, timeout, retries)
+
+    def transact_batch(self, commands: list, timeout: float = None) -> list:
+        """
+        Sends a sequence of commands in one write and collects their
+        replies in one pass. See SCLBus.transact_batch.
+        """
+        return self.bus.transact_batch(self.address, commands, timeout)
+
+    def transact_marked(self, commands: list, timeout: float) -> list:
+        """
+        Sends a batch that ends in an SS marker and waits for the marker
+        without holding the bus. See SCLBus.transact_marked.
+        """
+        return self.bus.transact_marked(self.address, commands, timeout)
+
+    def query(self, command: str, timeout: float = None, retries: int = None):
+        """
+        Sends a command that answers and returns its parsed value
+        """
+        reply = self.transact(command, timeout, retries)
+        if reply is None:
+            raise SCLError(command, "command does not answer")
+        return reply.value
+
+    async def async_send(self, command: str) -> None:
+        await self.transport.transact(self.address, command)
+
+    async def async_transact(self, command: str, timeout: float = None, retries: int = None):
+        return await self.transport.transact(self.address, command, timeout, retries)
+
+    async def async_transact_batch(self, commands: list, timeout: float = None) -> list:
+        return await self.transport.transact_batch(self.address, commands, timeout)
+
+    async def async_query(self, command: str, timeout: float = None, retries: int = None):
+        reply = await self.transport.transact(self.address, command, timeout, retries)
+        if reply is None:
+            raise SCLError(command, "command does not answer")
+        return reply.value
+
+    def run_async(self, coro):
+        """
+        Runs one of the async_ methods to completion on the background
+        loop, this is what the synchronous move API is built on
+        """
+        return AsyncTransport.run(coro)
+
+    def read_frame(self, timeout: float = None):
+        """
+        Reads one carriage return terminated reply from the bus, see SCLBus.read_frame
+        """
+        return self.bus.read_frame(timeout)
 
     def get_output(self, ret= False ):
-        response = self.ser.read(15)
+        response = self.read_frame()
+        if response is None:
+            response = b""
         #print(response)
         try:
             text = response.decode()
             if ret:
-                self.flush()
                 return text
             if len(text) > 0:
                 print (text)
-                self.flush()
             
         except:
             if ret:
-                self.flush()
                 return response.hex()
             else:
-                self.flush()
                 print(response.hex())
 
     def send_get_out(self, command, ret=False):
-        self.send(command)
-        return self.get_output(ret=ret)
+        spec = SCLCommand.lookup(command)
+        if spec is None:
+            # unknown command, we can't tell whether it answers so read whatever comes back
+            with self.bus.turn(self.address):
+                self.flush_input()
+                self.bus.write(self.address, command)
+                return self.get_output(ret=ret)
+        try:
+            reply = self.transact(command)
+        except SCLError as e:
+            if ret:
+                raise
+            print(e)
+            return
+        text = "" if reply is None else reply.frame
+        if ret:
+            return text
+        if len(text) > 0:
+            print(text)
 
     def motor_setup(self):
             """
             Setup initial motor parameters, also resets alarm
             """
             self.flush()
-            self.send('IFD') # Sets the format of drive responses to decimal
-            self.send('SP0') # Sets the starting position at 0
+            self.transact_batch([
+                'IFD', # Sets the format of drive responses to decimal
+                'SP0'  # Sets the starting position at 0
+            ])
 
     def set_steps_per_rotation(self, steps: int) -> None:
         if type(steps) is not int:
@@ -214,7 +414,12 @@ class StepperControl:
             return
 
         sub = self.get_closest_value_in_steps_range(steps)
-        self.send('MR{}'.format(sub[0]))
+        for command in self.register_commands({"MR": sub[0]}):
+            self.send(command)
+            # the manual warns MR corrupts the speed and ramps, they are sent again with the next move
+            for code in ("VE", "AC", "DE"):
+                self.registers.pop(code, None)
+        self.note_registers({"MR": sub[0]})
         self.stepsPerRot = sub[1] 
         #print("Set resolution to {} steps per rev, gear ratio {}, total steps per rev {}".format(self.stepsPerRot, self.gear_ratio, self.stepsPerRot * self.gear_ratio))
 
@@ -236,100 +441,558 @@ class StepperControl:
         self.flush_output()
 
     def flush_input(self):
-        self.ser.flushInput()
+        self.bus.flush_input()
 
     def flush_output(self):
         self.ser.flushOutput()
 
     def clear_alarm(self):
         self.send("AR")
+        self.known_status = None
 
     def motor_enable(self, enable=True):
         if enable == 1:
             print("Set motor enable true")
             self.send("ME")
+            self.known_status = None
             self.enabled = True 
         elif enable == 0:
             print("Set motor enable false")
             self.send("MD")
+            self.known_status = None
             self.enabled = False
     
     def get_status(self):
-        ret=self.send_get_out("SC", ret=True)
-        ret = int(ret[3:])
-        ret = int(bin(ret).replace("0b", ""))
-        ret = "%016i"%(ret)
-        print(ret)
-        true_strings = ["Motor Enabled and in position",
-                        "Sampling",
-                        "Drive Fault (check Alarm Code)",
-                        "In Position, only valid on servo and StepSERVO drives",
-                        "Moving",
-                        "Jogging",
-                        "Stopping",
-                        "Waiting",
-                        "Saving",
-                        "Alarm present (check Alarm Code)",
-                        "Homing",
-                        "Waiting",
-                        "Wizard running",
-                        "Checking encoder",
-                        "Q Program is running",
-                        "Initializing"]
-        for i in range(0,16):
-            if ret[i]=="1":
-                print(true_strings[15-i])
-
-    def validate_position(self) -> bool: 
-        actualPos = int(self.send_get_out("SP", True)[3:])
+        status = self.query("SC")
+        print(SCLResponse.bits(status))
+        for text in reversed(SCLResponse.describe(status, SCLResponse.STATUS_TEXT)):
+            print(text)
+
+    def poll_delay(self, elapsed: float, expected: float) -> float:
+        """
+        Seconds to wait before the next SC poll of a move expected to take
+        expected seconds (None if unknown), elapsed seconds after it started.
+        Most of the move is slept through, the end is polled at up to
+        max_poll_rate, and a move that overruns its estimate is polled less
+        and less often, at least every half second. With telemetry on the
+        move is sampled at the telemetry rate throughout instead.
+        """
+        if self.telemetry is not None:
+            return 1.0 / self.telemetry.rate
+        gap = 1.0 / self.max_poll_rate
+        if expected is None:
+            expected = 0.0
+        remaining = expected - elapsed
+        if remaining > gap:
+            return max(gap, 0.8 * remaining)
+        return min(max(gap, 0.1 * -remaining), max(gap, 0.5))
+
+    def set_telemetry(self, rate: float, size: int = 4096) -> None:
+        """
+        Records IP, IE and SC rate times a second during moves, 0 turns it off
+        """
+        if rate <= 0:
+            self.telemetry = None
+        elif self.telemetry is None or self.telemetry.size != size:
+            self.telemetry = Telemetry.Telemetry(rate, size)
+        else:
+            self.telemetry.rate = rate
+
+    def record_sample(self, t: float, replies: list) -> StatusWord:
+        status = replies[-1].value
+        encoder = replies[1].value if len(replies) == 3 else 0
+        self.telemetry.record(t, replies[0].value, encoder, status)
+        return status
+
+    def poll_move(self) -> StatusWord:
+        """
+        Reads the status word, with the rest of a telemetry sample if recording
+        """
+        if self.telemetry is None:
+            return self.query("SC")
+        while True:
+            t = time.time()
+            try:
+                return self.record_sample(t, self.transact_batch(self.telemetry.commands()))
+            except SCLNackError as e:
+                if e.command != "IE":
+                    raise
+                # no encoder on this drive
+                self.telemetry.encoder = False
+
+    async def async_poll_move(self) -> StatusWord:
+        if self.telemetry is None:
+            return await self.async_query("SC")
+        while True:
+            t = time.time()
+            try:
+                return self.record_sample(t, await self.async_transact_batch(self.telemetry.commands()))
+            except SCLNackError as e:
+                if e.command != "IE":
+                    raise
+                self.telemetry.encoder = False
+
+    def wait_for_move(self, expected: float, progress: bool = True):
+        """
+        Polls SC on the poll_delay schedule until the drive stops moving,
+        returning the final status word, printing a dot per poll if progress.
+        If SC can't be read waits out the expected time instead and returns None.
+        """
+        start = time.monotonic()
+        while True:
+            time.sleep(self.poll_delay(time.monotonic() - start, expected))
+            try:
+                status = self.poll_move()
+            except SCLError:
+                print("SC unexpected output, default to waiting")
+                if expected is not None:
+                    time.sleep(max(0.0, expected - (time.monotonic() - start)))
+                return None
+            if progress:
+                print(".", end="", flush=True)
+            if not status & StatusWord.MOVING:
+                self.note_status(status)
+                return status
+
+    async def async_wait_for_move(self, expected: float, progress: bool = True):
+        start = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_delay(time.monotonic() - start, expected))
+            try:
+                status = await self.async_poll_move()
+            except SCLError:
+                print("SC unexpected output, default to waiting")
+                if expected is not None:
+                    await asyncio.sleep(max(0.0, expected - (time.monotonic() - start)))
+                return None
+            if progress:
+                print(".", end="", flush=True)
+            if not status & StatusWord.MOVING:
+                self.note_status(status)
+                return status
+
+    def tune(self, low: float, high: float) -> bool:
+        """
+        Finds the fastest reliable VE and AC/DE moving between low and high
+        (deg or mm) and keeps them for this axis, see Tuning.AxisTuner
+        """
+        return Tuning.AxisTuner(self, low, high).run()
+
+    def load_tuning(self) -> None:
+        if Tuning.load_tuning(self):
+            print(f"{self.name} runs at tuned VE{self.velocity} AC{self.accel} DE{self.decel}")
+
+    def move_registers(self) -> dict:
+        """
+        The speed and ramp registers moves run with, these are what steps_to_time assumes
+        """
+        return {"AC": self.accel, "DE": self.decel, "VE": self.velocity}
+
+    def register_commands(self, values: dict) -> list:
+        """
+        Returns the commands that set the registers in values ({"VE": 1, ...}),
+        leaving out the ones the drive is known to hold already. Call
+        note_registers once they have been sent.
+        """
+        commands = []
+        for code in values:
+            if self.registers.get(code) != values[code]:
+                commands.append("{}{}".format(code, values[code]))
+        return commands
+
+    def note_registers(self, values: dict) -> None:
+        """
+        Records that the drive now holds values, after they were sent
+        without an error
+        """
+        self.registers.update(values)
+
+    async def async_start_move(self, t_steps: int) -> None:
+        """
+        Sends the move registers that changed and FL t_steps in one batch
+        """
+        registers = self.move_registers()
+        await self.async_transact_batch(self.register_commands(registers) + ['FL{}'.format(t_steps)])
+        self.note_registers(registers)
+
+    def invalidate_cache(self) -> None:
+        """
+        Forgets everything known about the drive, for when its state may
+        have changed behind our back: power cycles, alarms, raw commands
+        """
+        self.registers = {}
+        self.known_position = None
+        self.known_status = None
+
+    def note_position(self, position: int) -> None:
+        self.known_position = position
+        self.position_at = time.monotonic()
+
+    def note_status(self, status: StatusWord) -> None:
+        if status & (StatusWord.ALARM | StatusWord.FAULT):
+            # the drive may have stopped short, disabled itself or lost its settings
+            self.invalidate_cache()
+            return
+        self.known_status = status
+        self.status_at = time.monotonic()
+
+    def is_fresh(self, at: float) -> bool:
+        return time.monotonic() - at < self.cache_lifetime
+
+    def position_known(self) -> bool:
+        """
+        True if the last position read back agrees with where we think we are
+        """
+        return (self.known_position is not None and
+            self.known_position == self.targetedPosition and
+            self.is_fresh(self.position_at))
+
+    def validate_position(self, use_cache: bool = False) -> bool: 
+        if use_cache and self.position_known():
+            return True
+        actualPos = self.query("SP")
+        self.note_position(actualPos)
+        return self.check_position(actualPos)
+
+    async def async_validate_position(self, use_cache: bool = False) -> bool:
+        if use_cache and self.position_known():
+            return True
+        actualPos = await self.async_query("SP")
+        self.note_position(actualPos)
+        return self.check_position(actualPos)
+
+    def check_position(self, actualPos: int) -> bool:
         if (self.targetedPosition != actualPos):
             print("Severe error! Actuator may be in different position than we think!")
             print(self.targetedPosition, actualPos) 
             return False
         return True
 
-    def is_motor_on(self) -> bool:
-        status = int(self.send_get_out("SC", ret=True)[3:])
-        if status % 2 != 1:
+    def status_known(self) -> bool:
+        return self.known_status is not None and self.is_fresh(self.status_at)
+
+    def is_motor_on(self, use_cache: bool = False) -> bool:
+        if use_cache and self.status_known():
+            return self.check_motor_on(self.known_status)
+        status = self.query("SC")
+        self.note_status(status)
+        return self.check_motor_on(status)
+
+    async def async_is_motor_on(self, use_cache: bool = False) -> bool:
+        if use_cache and self.status_known():
+            return self.check_motor_on(self.known_status)
+        status = await self.async_query("SC")
+        self.note_status(status)
+        return self.check_motor_on(status)
+
+    def check_motor_on(self, status: StatusWord) -> bool:
+        enabled = bool(status & StatusWord.ENABLED)
+        if not enabled:
             print("Motor is not enabled!")
-        self.enabled = status % 2
-        return status % 2 == 1
+        self.enabled = enabled
+        return enabled
         
     def get_alarm(self):
-        ret=self.send_get_out("AL", ret=True)
-        ret = int(ret[3:])
-        ret = int(bin(ret).replace("0b", ""))
-        ret = "%016i"%(ret)
-        print(ret)
-        true_strings = ["Position Limit",
-                        "CCW Limit",
-                        "CW Limit",
-                        "Over Temp",
-                        "Internal Voltage",
-                        "Over Voltage",
-                        "Under Voltage",
-                        "Over Current",
-                        "Open Motor Winding",
-                        "Bad Encoder",
-                        "Comm Error",
-                        "Bad Flash",
-                        "No Move",
-                        "",
-                        "Blank Q Segment",
-                        ""]
-
-        if (int(ret) == 0):
+        alarm = self.query("AL")
+        print(SCLResponse.bits(alarm))
+        if alarm == 0:
             print("No alarm")
         else:
-            for i in range(0,16):
-                if ret[i]=="1":
-                    print(true_strings[15-i])
+            for text in reversed(SCLResponse.describe(alarm, SCLResponse.ALARM_TEXT)):
+                print(text)
+
+
+    def move_relative(self, amt: float) -> None:
+        return self.run_async(self.async_move_relative(amt))
+
+    def enqueue_move(self, target: float):
+        """
+        Queues a move to target (deg or mm) on this axis' motion queue and returns at once
+        """
+        return self.queue.put("move to {}".format(target), lambda: self.async_move_absolute(target))
+
+    def enqueue_move_relative(self, amt: float):
+        return self.queue.put("move by {}".format(amt), lambda: self.async_move_relative(amt))
+
+    def stop_queue(self) -> None:
+        """
+        Drops the queued moves and stops the one running (SK), then reads
+        back where the axis stopped
+        """
+        dropped = self.queue.cancel()
+        print(f"Dropped {dropped} queued move(s)")
+        if self.queue.busy():
+            self.send("SK")
+            self.queue.wait()
+            self.resync_position()
+
+    def resync_position(self) -> None:
+        """
+        Takes the drive's position as the truth after a move was cut short
+        """
+        actualPos = self.query("SP")
+        self.set_target(self.value_of(actualPos), actualPos)
+        self.note_position(actualPos)
+        self.make_log_entry()
+        print(f"{self.name} stopped at {self.get_target():.5f}")
+
+    def move_absolute(self, target: float) -> None:
+        return self.run_async(self.async_move_absolute(target))
+
+    async def async_move_relative(self, amt: float) -> None:
+        return
+
+    async def async_move_absolute(self, target: float) -> None:
+        return
+
+    async def async_step_to(self, target: float) -> bool:
+        """
+        Absolute move to target (deg or mm) without any printing, for scans
+        that have checked their points against the limits already. Returns
+        whether the drive ended up where it should.
+        """
+        if (not await self.async_validate_position(True) or not await self.async_is_motor_on(True)):
+            return False
+        t_steps = self.position_of(target) - self.targetedPosition
+        self.set_target(self.value_of(self.targetedPosition + t_steps), self.targetedPosition + t_steps)
+        self.previous_move = t_steps
+        await self.async_start_move(t_steps)
+        await self.async_wait_for_move(self.steps_to_time(t_steps), False)
+        self.make_log_entry()
+        return await self.async_validate_position()
+
+    def define_program(self, program: QProgram.QProgram) -> None:
+        self.programs[program.name] = program
+
+    def bind_program(self, name: str, segment: int) -> None:
+        """
+        Marks a program as stored in Q segment segment, 0 to send it each time again
+        """
+        if name not in self.programs:
+            print(f"No program named {name}!")
+            return
+        self.programs[name].segment = segment
+
+    def list_programs(self) -> None:
+        if len(self.programs) == 0:
+            print("No programs defined")
+        for name in self.programs:
+            print(self.programs[name])
+
+    def run_program(self, name: str) -> bool:
+        program = self.programs.get(name)
+        if program is None:
+            print(f"No program named {name}!")
+            return False
+        return self.execute_program(program)
+
+    def execute_program(self, program: QProgram.QProgram) -> bool:
+        """
+        Runs a program as one unit. Every point it moves to is checked
+        against the limits first. A program bound to a Q segment is started
+        with QX and watched through the status word. One that fits the
+        drive's command buffer is written in one go and its completion
+        marker is waited for with the bus free for the other drives, a
+        longer one is streamed with CommandStream.
+        """
+        name = program.name
+        for pos, homed in program.positions(self.targetedPosition):
+            if homed:
+                value = program.home_value + self.from_steps(pos)
+            else:
+                value = self.value_of(pos)
+            if not self.in_valid_range(value):
+                print(f"Program {name} would put it out of range! Limits: ({self.lowerLimit}, {self.upperLimit}), Given: {value:.5f}")
+                return False
+
+        if (not self.validate_position() or not self.is_motor_on()):
+            print("Program not executed!")
+            return False
+
+        timeout = 1.5 * program.estimate_time(self.targetedPosition, self.steps_to_time) + 2.0
+        # programs set their own speeds
+        self.registers = {}
+        print(f"Running program {name}...")
+        try:
+            if program.segment > 0:
+                self.send("QX{}".format(program.segment))
+                time.sleep(0.2)
+                deadline = time.monotonic() + timeout
+                while self.query("SC") & StatusWord.Q_RUNNING:
+                    if time.monotonic() > deadline:
+                        print(f"Program {name} still running after {timeout:.1f} s!")
+                        return False
+                    time.sleep(0.05)
+            elif program.fits(self.address):
+                self.transact_marked(program.compile(), timeout)
+            else:
+                CommandStream.CommandStream(self).run(program.commands, program.marker(), timeout)
+        except SCLError as e:
+            print(f"Program {name} did not report completion, position unknown!\n{e}")
+            return False
+
+        end, homed = program.end_position(self.targetedPosition)
+        if homed:
+            self.set_target(program.home_value + self.from_steps(end), end)
+        else:
+            self.set_target(self.value_of(end), end)
+        self.make_log_entry()
+        print(f"Program {name} finished")
+        return self.validate_position()
+
+    def scan(self, start: float, stop: float, step: float, dwell: float) -> bool:
+        """
+        Visits start, start + step, ... up to stop (deg or mm), resting
+        dwell seconds at each point. The points go to the drive as one
+        streamed program of absolute moves, so rounding to whole steps
+        doesn't add up along the scan.
+        """
+        try:
+            points = Scan.scan_range(start, stop, step)
+        except ValueError as e:
+            print(e)
+            return False
+        program = QProgram.scan_points(self, "scan", points, dwell, self.velocity)
+        print(f"Scanning {len(points)} points from {points[0]:.5f} to {points[-1]:.5f}")
+        return self.execute_program(program)
+
+    def step_scan(self, points: list, dwell: float, callback = None, optimize: bool = False) -> Scan.StepScan:
+        """
+        Step-and-dwell scan over points (deg or mm) run from the host, with
+        callback(index, point) called at every point, see Scan.StepScan.
+        With optimize the points are visited in the quickest order found by
+        ScanOrder.optimize rather than as given. Returns the scan with its
+        arrival and departure times filled in.
+        """
+        if optimize:
+            ordered = ScanOrder.optimize([self], points)
+            if ordered is not None:
+                points = ordered
+        scan = Scan.StepScan(self, points, dwell, callback)
+        scan.run()
+        return scan
+
+    def continuous_scan(self, start: float, stop: float, speed: float, rate: float = None) -> Scan.ContinuousScan:
+        """
+        Crosses start to stop (deg or mm) at a constant speed (deg/s or
+        mm/s) recording timestamped positions, see Scan.ContinuousScan.
+        """
+        scan = Scan.ContinuousScan(self, start, stop, speed, rate)
+        scan.run()
+        return scan
+
+    def position_of(self, value: float) -> int:
+        """
+        Drive position in steps of a target in deg or mm, the nearest step
+        """
+        if self.calibration is not None:
+            return int(np.floor(self.calibration.position(value) + 0.5))
+        return self.targetedPosition + int(self.nearest_steps(value - self.get_target()))
+
+    def value_of(self, position: int) -> float:
+        """
+        Target in deg or mm of a drive position in steps, or of an array of them
+        """
+        if self.calibration is not None:
+            return self.calibration.value(position)
+        return self.get_target() + self.from_steps(position - self.targetedPosition)
+
+    def parse_target(self, target: str) -> float:
+        """
+        A target as typed, a position in deg or mm, LinearControl also takes
+        IN/OUT. Raises ValueError for anything else.
+        """
+        return float(target)
+
+    def add_calibration_point(self, measured: float) -> bool:
+        """
+        Records that the axis, at its current drive position, was measured
+        at measured (deg or mm), and saves the table next to the log. Moves
+        go through the table once it has two points.
+        """
+        table = self.calibration or CalibrationTable.load_table(self) or CalibrationTable.CalibrationTable()
+        try:
+            table.add(self.targetedPosition, measured)
+        except ValueError as e:
+            print(e)
+            return False
+        CalibrationTable.save_table(self, table)
+        if table.usable():
+            self.calibration = table
+            self.set_target(self.value_of(self.targetedPosition), self.targetedPosition)
+        print(f"{len(table)} calibration point(s) saved to {CalibrationTable.table_file(self)}")
+        return True
+
+    def load_calibration(self) -> None:
+        table = CalibrationTable.load_table(self)
+        if table is not None and table.usable():
+            self.calibration = table
+            print(f"{self.name} uses a calibration table of {len(table)} points")
+
+    def clear_calibration(self) -> None:
+        """
+        Forgets the calibration table and deletes its file, conversions are linear again
+        """
+        self.calibration = None
+        if os.path.exists(CalibrationTable.table_file(self)):
+            os.remove(CalibrationTable.table_file(self))
+
+    def retire_calibration(self) -> None:
+        """
+        Stops using the calibration table once the step frame it was
+        measured in is reset (SP0). Its file is kept as <log>.cal.old so
+        the measurements aren't lost, but it isn't loaded again.
+        """
+        file_name = CalibrationTable.table_file(self)
+        if self.calibration is None and not os.path.exists(file_name):
+            return
+        self.calibration = None
+        if os.path.exists(file_name):
+            os.replace(file_name, file_name + ".old")
+        print(f"The step frame changed, calibration table moved to {file_name}.old, measure it again with calpoint")
+
+    def to_steps(self, amount: float) -> int:
+        return
+
+    def from_steps(self, steps: int) -> float:
+        return
+
+    def nearest_steps(self, amounts):
+        """
+        The whole number of steps nearest to amount(s) in deg or mm, halves
+        rounded up. Unlike round, shifting the amount by whole steps shifts
+        the result by exactly as many, so a target rounds to the same drive
+        position whichever step the axis starts from.
+        """
+        return np.floor(np.asarray(amounts, dtype=np.float64) / self.from_steps(1) + 0.5).astype(np.int64)
+
+    def plan_moves(self, values):
+        """
+        Plans absolute moves through an array of targets (deg or mm) in one
+        go, starting from the current target. Returns NumPy arrays of the
+        drive position each target rounds to (what position_of gives, and
+        so what scans and absolute moves through the targets reach, as the
+        nearest step doesn't depend on the step the axis comes from), the
+        residual in deg or mm (reached - requested, as
+        get_diff_in_requested_position) and the predicted time of each
+        move, the first one from where the axis is.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.calibration is not None:
+            positions = np.floor(self.calibration.position(values) + 0.5).astype(np.int64)
+        else:
+            positions = self.targetedPosition + self.nearest_steps(values - self.get_target())
+        residuals = self.value_of(positions) - values
+        moves = np.diff(positions, prepend=self.targetedPosition)
+        return positions, residuals, self.motion_model().move_times(moves)
 
+    def get_target(self) -> float:
+        return
 
-    def move_relative(self):
+    def set_target(self, value: float, position: int) -> None:
         return
 
-    def move_absolute(self):
+    def in_valid_range(self, value: float) -> bool:
         return
 
     def angle_to_steps(self):
@@ -338,8 +1001,20 @@ class StepperControl:
     def steps_to_angle(self):
         return
 
-    def steps_to_time(self):
-        return
+    def motion_model(self) -> MotionModel.MotionModel:
+        return MotionModel.MotionModel(self.accel, self.decel, self.velocity, self.stepsPerRot)
+
+    def steps_to_time(self, steps: int) -> float:
+        """
+        Seconds a move of steps takes with the current speed and ramps
+        """
+        return self.motion_model().move_time(steps)
+
+    def predict_move_time(self, amount: float) -> float:
+        """
+        Seconds a move by amount (deg or mm) takes, after rounding to whole steps
+        """
+        return self.steps_to_time(self.to_steps(amount))
 
     def get_angle(self):
         return
@@ -386,54 +1061,42 @@ class RotationControl(StepperControl):
         connect_timeout: float = 60,
         port: str = "/dev/ttyS4",
         gear_ratio: float = 14.0 / 1.0,
-        model_code: str ="ff0716"):
+        model_code: str ="ff0716",
+        baudrate: int = DEFAULT_BAUD_RATE,
+        address: str = ""):
         self.actuatorType = "ROT"
         self.targetedAngle=0
         self.lowerLimit = 0
         self.upperLimit = 90
-        super().__init__(name, logger, power, stepsPerRot, connect_timeout, port, gear_ratio, model_code)
+        super().__init__(name, logger, power, stepsPerRot, connect_timeout, port, gear_ratio, model_code, baudrate, address)
     
-    def move_relative(self, deg: float) -> None:
+    async def async_move_relative(self, deg: float) -> None:
         if not self.angle_in_valid_range(deg + self.targetedAngle):
             print("Move would put it out of range!")
             return
     
-        if (not self.validate_position() or not self.is_motor_on()):
+        if (not await self.async_validate_position(True) or not await self.async_is_motor_on(True)):
             print("Move not executed!")
             return
     
-        t_steps = self.angle_to_steps(deg)
-        self.targetedAngle  += self.steps_to_angle(t_steps)
-        self.targetedPosition += t_steps
+        start = self.targetedAngle
+        t_steps = self.position_of(start + deg) - self.targetedPosition
+        self.set_target(self.value_of(self.targetedPosition + t_steps), self.targetedPosition + t_steps)
     
-        print("Diff in move {:.5f} deg".format(self.get_diff_in_requested_position(t_steps, deg)))
+        print("Diff in move {:.5f} deg".format(self.targetedAngle - start - deg))
         # we want the timing predictable
-        self.send("VE1")
-        self.send('FL{}'.format(t_steps))
+        await self.async_start_move(t_steps)
         esttime = self.steps_to_time(t_steps)
         self.previous_move = t_steps
 
-        print("Moving by {:.5f} degrees".format(self.steps_to_angle(t_steps)))
-        time.sleep(0.2)
+        print("Moving by {:.5f} degrees".format(self.targetedAngle - start))
         print("Moving...")
-        while True:
-            ret=self.send_get_out("SC", True)
-            try:
-                print(".", end="", flush=True)
-                ret = int(ret[3:])
-                ret = int(bin(ret).replace("0b", ""))
-                ret = "%016i"%(ret)
-                if ret[11] == "0":
-                    break
-            except:
-                print("SC unexpected output, default to waiting")
-                time.sleep(esttime)
-                break
+        await self.async_wait_for_move(esttime)
 
         self.make_log_entry()
         print(" Move Finished")
         
-        self.validate_position()
+        await self.async_validate_position()
 
     def move(self, target: str):
         try:
@@ -444,59 +1107,69 @@ class RotationControl(StepperControl):
  
         self.move_absolute(ang)
 
-    def move_absolute(self, target: float) -> None:
+    async def async_move_absolute(self, target: float) -> None:
         if not self.angle_in_valid_range(target):
             print("Move would put it out of range! Limits: ({}, {}), Given:{}".format(self.lowerLimit, self.upperLimit, target))
             return
 
-        if (not self.validate_position() or not self.is_motor_on()):
+        if (not await self.async_validate_position(True) or not await self.async_is_motor_on(True)):
             print("Move not executed!")
             return
 
-        diff = target - self.targetedAngle
-        t_steps = self.angle_to_steps(diff)
-        print("Diff in move {:.5f} deg".format(self.get_diff_in_requested_position(t_steps, diff)))
-
-        self.targetedAngle += self.steps_to_angle(t_steps) 
-        self.targetedPosition += t_steps
+        t_steps = self.position_of(target) - self.targetedPosition
+        self.set_target(self.value_of(self.targetedPosition + t_steps), self.targetedPosition + t_steps)
+        print("Diff in move {:.5f} deg".format(self.targetedAngle - target))
 
-        self.send("VE1")
-        self.send('FL{}'.format(t_steps))
+        await self.async_start_move(t_steps)
         esttime = self.steps_to_time(t_steps)
         self.previous_move = t_steps
 
         print("Moving to {:.5f} deg".format(self.targetedAngle))
-        time.sleep(0.2)
         print("Moving...", end="", flush=True)
-        while True:
-            ret=self.send_get_out("SC", True)
-            try:
-                ret = int(ret[3:])
-                ret = int(bin(ret).replace("0b", ""))
-                ret = "%016i"%(ret)
-                print(".", end="", flush=True)
-                if ret[11] == "0":
-                    break
-            except:
-                print("SC unexpected output, default to waiting")
-                time.sleep(esttime)
-                break
+        await self.async_wait_for_move(esttime)
 
         self.make_log_entry()
         print(" Move Finished")
 
-        self.validate_position()
+        await self.async_validate_position()
 
     def angle_to_steps(self, angle_deg: float) -> int:
         return int((angle_deg / 360) * self.stepsPerRot * self.gear_ratio)
 
+    def angles_to_steps(self, angles_deg):
+        """
+        angle_to_steps for an array of angles, truncating toward zero the same way
+        """
+        return np.trunc(np.asarray(angles_deg, dtype=np.float64) / 360 * self.stepsPerRot * self.gear_ratio).astype(np.int64)
+
+    def steps_to_angles(self, steps):
+        return np.asarray(steps, dtype=np.float64) * (360 / (self.stepsPerRot * self.gear_ratio))
+
+    def plan_angles(self, angles):
+        """
+        plan_moves for an array of angles (deg)
+        """
+        return self.plan_moves(angles)
+
+    def to_steps(self, amount: float) -> int:
+        return self.angle_to_steps(amount)
+
+    def from_steps(self, steps: int) -> float:
+        return self.steps_to_angle(steps)
+
+    def get_target(self) -> float:
+        return self.targetedAngle
+
+    def set_target(self, value: float, position: int) -> None:
+        self.targetedAngle = value
+        self.targetedPosition = position
+
+    def in_valid_range(self, value: float) -> bool:
+        return self.angle_in_valid_range(value)
+
     def steps_to_angle(self, steps: int) -> float:
         return steps * (360 / (self.stepsPerRot * self.gear_ratio))
 
-    def steps_to_time(self, steps: int) -> float:
-        # assumes VE1 has been called
-        return abs(1.1 * float(steps) / float(self.stepsPerRot))
-
     def get_angle(self):
         print(self.targetedAngle)
         return self.targetedAngle
@@ -516,6 +1189,8 @@ class RotationControl(StepperControl):
         self.targetedAngle = calibrate_position
         self.targetedPosition = 0
         self.send("SP0")
+        self.note_position(0)
+        self.retire_calibration()
 
     def angle_in_valid_range(self, angle: float) -> bool: 
         return (
@@ -552,9 +1227,11 @@ class RotationControl(StepperControl):
             self.set_limits(float(low), float(high))
             if (self.booted):
                 self.send("SP"+str(int(pos)))
+                self.note_position(int(pos))
         else:
             if (self.booted):
                 self.send("SP0")
+                self.note_position(0)
             self.set_steps_per_rotation(2000)
 
     def print_limits(self):
@@ -657,112 +1334,121 @@ class LinearControl(StepperControl):
         connect_timeout: float = 60,
         port: str = "/dev/ttyS4",
         gear_ratio: float = 14.0 / 1.0,
-        model_code: str ="ff0716"):
+        model_code: str ="ff0716",
+        baudrate: int = DEFAULT_BAUD_RATE,
+        address: str = ""):
         self.actuatorType = "LIN"
+        self.velocity = 10
         self.targeted_mm=0
         self.lowerLimit = 0 
         self.upperLimit = 150
         self.stepsPerMM = 2000
-        super().__init__(name, logger, power, stepsPerRot, connect_timeout, port, gear_ratio, model_code)
+        # calibrate finds each limit at seek_velocity, backs off backoff_mm
+        # and finds it again at approach_velocity (rev/sec)
+        self.seek_velocity = 20
+        self.approach_velocity = 1
+        self.backoff_mm = 2.0
+        # how far the travel found may be from what the old calibration predicts
+        self.calibration_tolerance = 0.25
+        # ((input, condition), (input, condition)) of the low and high
+        # switches for homing on the drive, None to home from here
+        self.home_inputs = None
+        super().__init__(name, logger, power, stepsPerRot, connect_timeout, port, gear_ratio, model_code, baudrate, address)
     
     def steps_to_mm(self, steps: int):
         return steps / self.stepsPerMM
 
-    def move_relative(self, pos: float) -> None:
-        if not self.pos_in_valid_range(pos + self.targeted_mm):
+    async def async_move_relative(self, pos: float) -> None:
+        if not self.mm_in_valid_range(pos + self.targeted_mm):
             print("Move would put it out of range!")
             return
     
-        if (not self.validate_position() or not self.is_motor_on()):
+        if (not await self.async_validate_position(True) or not await self.async_is_motor_on(True)):
             print("Move not executed!")
             return
     
-        t_steps = self.mm_to_steps(pos)
-        self.targeted_mm  += self.steps_to_mm(t_steps)
-        self.targetedPosition += t_steps
+        start = self.targeted_mm
+        t_steps = self.position_of(start + pos) - self.targetedPosition
+        self.set_target(self.value_of(self.targetedPosition + t_steps), self.targetedPosition + t_steps)
     
-        print("Diff in move {:.5f} mm".format(self.get_diff_in_requested_position(t_steps, pos)))
+        print("Diff in move {:.5f} mm".format(self.targeted_mm - start - pos))
         # we want the timing predictable
-        self.send("VE10")
-        self.send('FL{}'.format(t_steps))
+        await self.async_start_move(t_steps)
         esttime = self.steps_to_time(t_steps)
         self.previous_move = t_steps
 
-        print("Moving by {:.5f} mm".format(self.steps_to_mm(t_steps)))
-        time.sleep(0.2)
+        print("Moving by {:.5f} mm".format(self.targeted_mm - start))
         print("Moving...", end="", flush=True)
-        while True:
-            ret=self.send_get_out("SC", True)
-            try:
-                ret = int(ret[3:])
-                ret = int(bin(ret).replace("0b", ""))
-                ret = "%016i"%(ret)
-                print(".", end="", flush=True)
-                if ret[11] == "0":
-                    break
-            except:
-                print("SC unexpected output, default to waiting")
-                time.sleep(esttime)
-                break
+        await self.async_wait_for_move(esttime)
 
         self.make_log_entry()
         print(" Move Finished")
         
-        self.validate_position()
+        await self.async_validate_position()
 
-    def move_absolute(self, target: float) -> None:
+    async def async_move_absolute(self, target: float) -> None:
         if not self.mm_in_valid_range(target):
             print("Move would put it out of range! Limits: ({}, {}), Given:{}".format(self.lowerLimit, self.upperLimit, target))
             return
 
-        if (not self.validate_position() or not self.is_motor_on()):
+        if (not await self.async_validate_position(True) or not await self.async_is_motor_on(True)):
             print("Move not executed!")
             return
 
-        diff = target - self.targeted_mm
-        t_steps = self.mm_to_steps(diff)
-        print("Diff in move {:.5f} mm".format(self.get_diff_in_requested_position(t_steps, diff)))
-
-        self.targeted_mm += self.steps_to_mm(t_steps) 
-        self.targetedPosition += t_steps
+        t_steps = self.position_of(target) - self.targetedPosition
+        self.set_target(self.value_of(self.targetedPosition + t_steps), self.targetedPosition + t_steps)
+        print("Diff in move {:.5f} mm".format(self.targeted_mm - target))
 
-        self.send("VE10")
-        self.send('FL{}'.format(t_steps))
+        await self.async_start_move(t_steps)
         esttime = self.steps_to_time(t_steps)
         self.previous_move = t_steps
 
         print("Moving to {:.5f} mm".format(self.targeted_mm))
-        time.sleep(0.2)
         print("Moving...", end="", flush=True)
-        while True:
-            ret=self.send_get_out("SC", True)
-            try:
-                ret = int(ret[3:])
-                ret = int(bin(ret).replace("0b", ""))
-                ret = "%016i"%(ret)
-                print(".", end="", flush=True)
-                if ret[11] == "0":
-                    break
-            except:
-                print("SC unexpected output, default to waiting")
-                time.sleep(esttime)
-                break
+        await self.async_wait_for_move(esttime)
 
         self.make_log_entry()
         print(" Move Finished")
 
-        self.validate_position()
+        await self.async_validate_position()
 
     def mm_to_steps(self, mm: float) -> int:
         return int( float(mm) * float(self.stepsPerMM) )
 
+    def mms_to_steps(self, mm):
+        """
+        mm_to_steps for an array of distances, truncating toward zero the same way
+        """
+        return np.trunc(np.asarray(mm, dtype=np.float64) * float(self.stepsPerMM)).astype(np.int64)
+
+    def steps_to_mms(self, steps):
+        return np.asarray(steps, dtype=np.float64) / self.stepsPerMM
+
+    def plan_mm(self, mm):
+        """
+        plan_moves for an array of positions (mm)
+        """
+        return self.plan_moves(mm)
+
+    def to_steps(self, amount: float) -> int:
+        return self.mm_to_steps(amount)
+
+    def from_steps(self, steps: int) -> float:
+        return self.steps_to_mm(steps)
+
+    def get_target(self) -> float:
+        return self.targeted_mm
+
+    def set_target(self, value: float, position: int) -> None:
+        self.targeted_mm = value
+        self.targetedPosition = position
+
+    def in_valid_range(self, value: float) -> bool:
+        return self.mm_in_valid_range(value)
+
     def steps_to_angle(self, steps: int) -> float:
         return steps * (1./ (self.stepsPerMM ))
 
-    def steps_to_time(self, steps: int) -> float:
-        # assumes VE10 has been called
-        return abs(10.0 * float(steps) / float(self.stepsPerMM))
-
     def get_mm(self):
         print(self.targeted_mm)
         return self.targeted_mm
@@ -773,56 +1459,134 @@ class LinearControl(StepperControl):
     def get_position(self):
         self.send_get_out("SP")
 
+    def seek_time(self, steps: int, velocity: float) -> float:
+        """
+        Seconds a move of steps takes at velocity (rev/sec) with the current ramps
+        """
+        return MotionModel.MotionModel(self.accel, self.decel, velocity, self.stepsPerRot).move_time(steps)
+
+    def seek_limit(self, direction: int, velocity: float, expected_steps: int) -> None:
+        """
+        Runs into the limit switch in direction (1 or -1) at velocity
+        (rev/sec) and waits until the drive stops there. expected_steps is
+        a guess at the distance, it only sets how often SC is polled, half
+        of it is used so a switch reached early is noticed soon enough.
+        """
+        registers = self.move_registers()
+        registers["VE"] = velocity
+        self.transact_batch(self.register_commands(registers) + ['FL{}'.format(direction * 100000000)])
+        self.note_registers(registers)
+        print("Moving...", end="", flush=True)
+        self.wait_for_move(self.seek_time(expected_steps // 2, velocity))
+        print("")
+
+    def home_to_limit(self, direction: int, expected_steps: int) -> None:
+        """
+        Finds the limit switch in direction fast, backs off and comes back
+        slowly, so the edge is found as precisely as a slow seek alone
+        would but in a fraction of the time
+        """
+        self.seek_limit(direction, self.seek_velocity, expected_steps)
+        backoff = self.mm_to_steps(self.backoff_mm)
+        self.transact_batch(['FL{}'.format(-direction * backoff)])
+        self.wait_for_move(self.seek_time(backoff, self.seek_velocity))
+        self.seek_limit(direction, self.approach_velocity, backoff)
+
+    def set_home_inputs(self, spec: str) -> None:
+        """
+        Takes the inputs the low and high limit switches are wired to as
+        "<input><condition>/<input><condition>" (e.g. 7F/8F), calibrate then
+        has the drive seek them with SH. "host" goes back to seeking them
+        from here.
+        """
+        if spec == "host":
+            self.home_inputs = None
+            return
+        low, high = spec.split("/")
+        self.home_inputs = ((int(low[0]), low[1]), (int(high[0]), high[1]))
+
+    def home_on_drive(self) -> int:
+        """
+        Has the drive seek the low switch, call it 0, and seek the high
+        switch, all from one batch of buffered commands, so the edges are
+        found with drive timing. Returns the position of the high switch.
+        """
+        (low_input, low_condition), (high_input, high_condition) = self.home_inputs
+        registers = self.move_registers()
+        registers["VE"] = self.seek_velocity
+        # the switches are read as plain inputs while homing, not as limits
+        commands = ['DL3'] + self.register_commands(registers) + [
+            "DI-1", "SH{}{}".format(low_input, low_condition), "SP0",
+            "DI1", "SH{}{}".format(high_input, high_condition), "SSHOMED"]
+        print("Homing on the drive...", flush=True)
+        try:
+            self.transact_marked(commands, 2 * QProgram.HOMING_TIMEOUT)
+            self.note_registers(registers)
+        except Exception:
+            # stop the seek before the switches are limits again
+            self.transact("SK")
+            raise
+        finally:
+            self.send('DL2')
+        return self.query("SP")
+
     def calibrate(self, mm_low: float, mm_high: float) -> None:
+        start = time.monotonic()
+        # running into the limit switches raises alarms
+        self.invalidate_cache()
+        if self.home_inputs is not None:
+            try:
+                final_pos = self.home_on_drive()
+            except SCLError as e:
+                print(f"Homing did not finish, not calibrated!\n{e}")
+                self.invalidate_cache()
+                self.resync_position()
+                return
+            self.finish_calibration(final_pos, mm_low, mm_high, start)
+            return
         #make sure limit switches are enabled
         self.send('DL2')
-        t_steps = -100000000
-        self.send('FL{}'.format(t_steps))
-        esttime = self.steps_to_time(t_steps)
-
-        time.sleep(0.2)
-        print("Moving...", end="", flush=True)
-        while True:
-            ret=self.send_get_out("SC", True)
-            try:
-                ret = int(ret[3:])
-                ret = int(bin(ret).replace("0b", ""))
-                ret = "%016i"%(ret)
-                print(".", end="", flush=True)
-                if ret[11] == "0":
-                    break
-            except:
-                print("SC unexpected output, default to waiting")
-                time.sleep(esttime)
-                break
-        print("")
+        # the old calibration tells roughly how far the limits are
+        travel = self.mm_to_steps(self.upperLimit - self.lowerLimit + 1)
+        self.home_to_limit(-1, max(0, self.targetedPosition))
 
         self.send("SP0")
+        self.note_position(0)
         time.sleep(1)
 
-        self.send("VE10")
-        t_steps = 100000000
-        self.send('FL{}'.format(t_steps))
-        esttime = self.steps_to_time(t_steps)
+        self.home_to_limit(1, travel)
 
-        print("Moving...", end="", flush=True)
-        time.sleep(0.2)
-        while True:
-            ret=self.send_get_out("SC", True)
-            try:
-                ret = int(ret[3:])
-                ret = int(bin(ret).replace("0b", ""))
-                ret = "%016i"%(ret)
-                print(".", end="", flush=True)
-                if ret[11] == "0":
-                    break
-            except:
-                print("SC unexpected output, default to waiting")
-                time.sleep(esttime)
-                break
-        print("")
+        self.finish_calibration(self.query("SP"), mm_low, mm_high, start)
+
+    def check_travel(self, final_pos: int, mm_low: float, mm_high: float) -> bool:
+        """
+        Checks the high switch found at final_pos steps before anything is
+        changed: it has to be above the low one and, once the axis has been
+        calibrated before, within calibration_tolerance of the travel the
+        old calibration predicts
+        """
+        if mm_high <= mm_low:
+            print(f"High limit {mm_high} mm must be above the low one {mm_low} mm!")
+            return False
+        if final_pos <= 0:
+            print(f"High limit switch found at {final_pos} steps, not above the low one!")
+            return False
+        expected = self.mm_to_steps(mm_high - mm_low)
+        if self.logger.get_last() is not None and abs(final_pos - expected) > self.calibration_tolerance * expected:
+            print(f"High limit switch found at {final_pos} steps, the old calibration puts it near {expected}!")
+            return False
+        return True
 
-        final_pos=int(self.send_get_out("SP", True)[3:])
+    def finish_calibration(self, final_pos: int, mm_low: float, mm_high: float, start: float) -> None:
+        """
+        Works out stepsPerMM and the limits from the high switch at final_pos steps above the low one
+        """
+        if not self.check_travel(final_pos, mm_low, mm_high):
+            print("Not calibrated, keeping the old calibration!")
+            self.invalidate_cache()
+            self.resync_position()
+            return
+        self.retire_calibration()
         self.stepsPerMM = final_pos/(mm_high-mm_low);
         self.targeted_mm = mm_high 
         self.targetedPosition = final_pos 
@@ -830,19 +1594,24 @@ class LinearControl(StepperControl):
         self.upperLimit = mm_high - 0.5 
         self.move_absolute(self.upperLimit)
         self.clear_alarm()
+        print("Calibration took {:.1f} s".format(time.monotonic() - start))
     
-    def move(self, pos: str):
-        if (pos == "IN"):
-            self.move_absolute(self.upperLimit)
-        elif (pos == "OUT"):
-            self.move_absolute(self.lowerLimit)
-        else:
-            try:
-                pos = float(pos)
-            except:
-                print("Invalid argument! IN/OUT or position (mm)")
+    def parse_target(self, target: str) -> float:
+        """
+        IN/OUT are the ends of the travel, anything else is a position in mm
+        """
+        ends = {"IN": self.upperLimit, "OUT": self.lowerLimit}
+        if target in ends:
+            return ends[target]
+        return float(target)
 
-            self.move_absolute(pos)
+    def move(self, pos: str):
+        try:
+            target = self.parse_target(pos)
+        except ValueError:
+            print("Invalid argument! IN/OUT or position (mm)")
+            return
+        self.move_absolute(target)
 
     def mm_in_valid_range(self, mm: float) -> bool: 
         return (
@@ -881,9 +1650,11 @@ class LinearControl(StepperControl):
             self.stepsPerMM = float(spmm)
             if (self.booted):
                 self.send("SP"+str(int(pos)))
+                self.note_position(int(pos))
         else:
             if (self.booted):
                 self.send("SP0")
+                self.note_position(0)
             self.set_steps_per_rotation(2000)
 
     def print_limits(self):
@@ -0,0 +1,72 @@
+import numpy as np
+
+
+class Telemetry:
+    """
+    Samples of an axis taken while it moves: time, motor position (IP),
+    encoder position (IE) and status word (SC). Samples go into
+    preallocated arrays used as a ring buffer, so recording costs no
+    allocation and the newest size samples are kept.
+    """
+    def __init__(self, rate: float = 20.0, size: int = 4096):
+        # samples per second while a move runs
+        self.rate = rate
+        self.size = size
+        # cleared if the drive has no encoder and rejects IE
+        self.encoder = True
+        self.time     = np.zeros(size, dtype=np.float64)
+        self.position = np.zeros(size, dtype=np.int32)
+        self.encoder_position = np.zeros(size, dtype=np.int32)
+        self.status   = np.zeros(size, dtype=np.uint16)
+        # samples ever recorded, the next one goes to count % size
+        self.count = 0
+
+    def commands(self) -> list:
+        """
+        The immediate commands that make up one sample, SC last
+        """
+        if self.encoder:
+            return ["IP", "IE", "SC"]
+        return ["IP", "SC"]
+
+    def record(self, t: float, position: int, encoder: int, status: int) -> None:
+        i = self.count % self.size
+        self.time[i] = t
+        self.position[i] = position
+        self.encoder_position[i] = encoder
+        self.status[i] = status
+        self.count += 1
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def arrays(self) -> dict:
+        """
+        Copies of the samples held, oldest first, keyed time, position,
+        encoder and status
+        """
+        n = len(self)
+        start = self.count % self.size if self.count > self.size else 0
+        order = (np.arange(n) + start) % self.size
+        return {
+            "time":     self.time[order],
+            "position": self.position[order],
+            "encoder":  self.encoder_position[order],
+            "status":   self.status[order],
+        }
+
+    def save(self, file_name: str) -> None:
+        """
+        Writes the samples to file_name, as NumPy arrays if it ends in .npz,
+        otherwise as comma separated text
+        """
+        data = self.arrays()
+        if file_name.endswith(".npz"):
+            np.savez(file_name, **data)
+            return
+        table = np.column_stack([data["time"], data["position"], data["encoder"], data["status"]])
+        np.savetxt(file_name, table, fmt=["%.6f", "%d", "%d", "%d"], delimiter=", ",
+            header="time(s), position(steps), encoder(counts), status")
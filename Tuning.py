@@ -0,0 +1,181 @@
+import os
+from SCLCommand import SCLNackError
+from SCLResponse import StatusWord
+
+# each tuning step multiplies the value under test by this
+STEP_FACTOR = 1.25
+# the tuned values are this much of the fastest ones that passed
+SAFETY_FACTOR = 0.8
+# the drive's largest VE (rev/sec) and AC/DE (rev/sec/sec)
+MAX_VELOCITY = 50.0
+MAX_ACCEL = 3000.0
+
+
+def tune_file(control) -> str:
+    """
+    Where an axis' tuned speeds are kept, next to its log
+    """
+    return control.logger.name + ".tune"
+
+
+def load_tuning(control) -> bool:
+    """
+    Sets the axis' velocity, accel and decel from its tune file, if it has one
+    """
+    file_name = tune_file(control)
+    if not os.path.exists(file_name):
+        return False
+    try:
+        with open(file_name) as fp:
+            header = fp.readline().split()
+            values = [float(v) for v in fp.readline().split()]
+        tuned = dict(zip(header, values))
+        velocity, accel, decel = tuned["velocity"], tuned["accel"], tuned["decel"]
+    except (ValueError, KeyError) as e:
+        print(f"Ignoring unreadable tune file {file_name}: {e}")
+        return False
+    control.velocity, control.accel, control.decel = velocity, accel, decel
+    return True
+
+
+def save_tuning(control) -> None:
+    with open(tune_file(control), "w") as fp:
+        fp.write("velocity   accel   decel\n")
+        fp.write("{}   {}   {}\n".format(control.velocity, control.accel, control.decel))
+
+
+def read_encoder(control):
+    """
+    The encoder position (IE), None if the drive has no encoder
+    """
+    try:
+        return control.query("IE")
+    except SCLNackError:
+        return None
+
+
+class AxisTuner:
+    """
+    Finds how fast an axis can reliably go. Moves back and forth between
+    low and high (deg or mm), first raising the ramps (AC and DE) with
+    the speed held, then the speed (VE) with the last ramps that passed,
+    STEP_FACTOR at a time. A setting passes if after every move the drive position
+    (SP) is where it should be, no alarm or fault is up, and, if there is
+    an encoder, the encoder moved as many steps as the motor was told to
+    within max_slip steps. The encoder is the only check that notices a
+    stalled stepper, without one the result should be taken with care.
+    """
+    def __init__(self, control, low: float, high: float, trials: int = 2,
+        max_velocity: float = MAX_VELOCITY, max_accel: float = MAX_ACCEL):
+        self.control = control
+        self.low = low
+        self.high = high
+        self.trials = trials
+        self.max_velocity = min(max_velocity, MAX_VELOCITY)
+        self.max_accel = min(max_accel, MAX_ACCEL)
+        # slip allowed per move, one full step of a 200 step motor
+        self.max_slip = max(1, control.stepsPerRot // 200)
+        # encoder counts per motor step, None without an encoder
+        self.ratio = None
+
+    def check_move(self, target: float) -> bool:
+        control = self.control
+        before = read_encoder(control) if self.ratio is not None else None
+        start = control.targetedPosition
+        if not control.run_async(control.async_step_to(target)):
+            return False
+        if control.query("AL") != 0 or control.query("SC") & (StatusWord.FAULT | StatusWord.ALARM):
+            print(" alarm raised")
+            return False
+        if self.ratio is None:
+            return True
+        steps = control.targetedPosition - start
+        slip = (read_encoder(control) - before) / self.ratio - steps
+        if abs(slip) > self.max_slip:
+            print(f" encoder off by {slip:.0f} steps")
+            return False
+        return True
+
+    def passes(self, velocity: float, accel: float) -> bool:
+        """
+        Tries velocity and accel, rounded to the 4 and 3 decimals the drive
+        takes, so the values checked are the ones it really ran with. After
+        a failure the drive's position is taken as the truth again.
+        """
+        control = self.control
+        velocity, accel = round(velocity, 4), round(accel, 3)
+        control.velocity, control.accel, control.decel = velocity, accel, accel
+        print("Trying VE{:.4f} AC{:.3f}...".format(velocity, accel), end="", flush=True)
+        for i in range(self.trials):
+            for target in (self.high, self.low):
+                if not self.check_move(target):
+                    print(" failed")
+                    control.resync_position()
+                    return False
+        print(" ok")
+        return True
+
+    def measure_encoder(self) -> None:
+        """
+        Counts per step from a move at the starting settings, which are
+        assumed to be safe
+        """
+        control = self.control
+        before = read_encoder(control)
+        if before is None:
+            print("No encoder, only the drive position and alarms are checked")
+            return
+        start = control.targetedPosition
+        control.run_async(control.async_step_to(self.high))
+        steps = control.targetedPosition - start
+        counts = read_encoder(control) - before
+        if steps == 0 or counts == 0:
+            print("Encoder did not count, only the drive position and alarms are checked")
+            return
+        self.ratio = counts / steps
+
+    def run(self) -> bool:
+        """
+        Tunes the axis and saves the result to its tune file. A failed
+        setting may have cost the motor steps, the axis should then be
+        recalibrated. Returns whether the starting settings passed.
+        """
+        control = self.control
+        for value in (self.low, self.high):
+            if not control.in_valid_range(value):
+                print("Tuning range out of range! Limits: ({}, {}), Given:{}".format(control.lowerLimit, control.upperLimit, value))
+                return False
+        if (not control.validate_position() or not control.is_motor_on()):
+            print("Tuning not started!")
+            return False
+        original = (control.velocity, control.accel, control.decel)
+        if not control.run_async(control.async_step_to(self.low)):
+            print("Tuning not started!")
+            return False
+        self.measure_encoder()
+
+        velocity, accel = control.velocity, min(control.accel, control.decel)
+        if not self.passes(velocity, accel):
+            control.velocity, control.accel, control.decel = original
+            print("Starting settings failed, nothing saved, check the axis!")
+            return False
+        failed = False
+        while accel * STEP_FACTOR <= self.max_accel:
+            if not self.passes(velocity, accel * STEP_FACTOR):
+                failed = True
+                break
+            accel *= STEP_FACTOR
+        while velocity * STEP_FACTOR <= self.max_velocity:
+            if not self.passes(velocity * STEP_FACTOR, accel):
+                failed = True
+                break
+            velocity *= STEP_FACTOR
+
+        control.velocity = max(original[0], round(SAFETY_FACTOR * velocity, 4))
+        control.accel = max(min(original[1:]), round(SAFETY_FACTOR * accel, 3))
+        control.decel = control.accel
+        save_tuning(control)
+        print("Tuned to VE{} AC{} DE{}, saved to {}".format(control.velocity, control.accel, control.decel, tune_file(control)))
+        if failed:
+            print("A failed setting may have cost the motor steps, recalibrate the axis if in doubt")
+        return True
@@ -0,0 +1,36 @@
+import numpy as np
+import MotionModel
+
+
+class FakeAxis:
+    """
+    Just enough of a StepperControl for the planners: steps_per_unit drive
+    steps per deg or mm, rounded to the nearest step, no serial port
+    """
+    def __init__(self, name: str, position: float = 0.0, steps_per_unit: float = 100.0,
+        lower: float = 0.0, upper: float = 100.0):
+        self.name = name
+        self.steps_per_unit = steps_per_unit
+        self.lowerLimit = lower
+        self.upperLimit = upper
+        self.target = position
+        self.targetedPosition = self.position_of(position)
+
+    def motion_model(self) -> MotionModel.MotionModel:
+        return MotionModel.MotionModel(10, 10, 1, 2000)
+
+    def in_valid_range(self, value: float) -> bool:
+        return self.lowerLimit <= value <= self.upperLimit
+
+    def position_of(self, value: float) -> int:
+        return int(np.floor(value * self.steps_per_unit + 0.5))
+
+    def plan_moves(self, values):
+        positions = np.floor(np.asarray(values, dtype=np.float64) * self.steps_per_unit + 0.5).astype(np.int64)
+        return positions, positions / self.steps_per_unit - values, self.motion_model().move_times(np.diff(positions, prepend=self.targetedPosition))
+
+    def get_target(self) -> float:
+        return self.target
+
+    def parse_target(self, target: str) -> float:
+        return float(target)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from CalibrationTable import CalibrationTable
+
+
+@pytest.fixture
+def table():
+    return CalibrationTable([0, 1000, 2000], [0.0, 10.0, 21.0])
+
+
+def test_interpolates(table):
+    assert table.value(500) == pytest.approx(5.0)
+    assert table.value(1500) == pytest.approx(15.5)
+
+
+def test_inverse(table):
+    assert table.position(15.5) == pytest.approx(1500)
+    steps = np.array([0, 250, 1000, 1999])
+    assert table.position(table.value(steps)) == pytest.approx(steps)
+
+
+def test_extrapolates_along_end_segments(table):
+    assert table.value(-1000) == pytest.approx(-10.0)
+    assert table.value(3000) == pytest.approx(32.0)
+    assert table.position(32.0) == pytest.approx(3000)
+
+
+def test_falling_table():
+    table = CalibrationTable([0, 1000, 2000], [50.0, 40.0, 25.0])
+    assert table.value(1500) == pytest.approx(32.5)
+    assert table.position(32.5) == pytest.approx(1500)
+
+
+def test_rejects_non_monotonic(table):
+    with pytest.raises(ValueError):
+        table.add(3000, 5.0)
+    # the table is left as it was
+    assert len(table) == 3
+    assert table.value(1500) == pytest.approx(15.5)
+
+
+def test_add_replaces_point(table):
+    table.add(1000, 11.0)
+    assert len(table) == 3
+    assert table.value(1000) == pytest.approx(11.0)
+
+
+def test_usable():
+    assert not CalibrationTable([0], [1.0]).usable()
+    assert CalibrationTable([0, 1], [1.0, 2.0]).usable()
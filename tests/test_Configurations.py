@@ -0,0 +1,47 @@
+from Configurations import Planner, Rule
+from fakes import FakeAxis
+
+
+def names(stages):
+    return [sorted((c.name, t) for c, t in stage) for stage in stages]
+
+
+def test_nothing_to_do():
+    assert Planner([FakeAxis("a", 10.0)], []).plan([("a", "10")]) == []
+
+
+def test_independent_moves_share_a_stage():
+    planner = Planner([FakeAxis("a"), FakeAxis("b")], [])
+    assert names(planner.plan([("a", "10"), ("b", "20")])) == [[("a", 10.0), ("b", 20.0)]]
+
+
+def test_order_rule():
+    planner = Planner([FakeAxis("a"), FakeAxis("b")], [Rule("order", "a", "b")])
+    assert names(planner.plan([("a", "10"), ("b", "20")])) == [[("a", 10.0)], [("b", 20.0)]]
+
+
+def test_clear_rule_moves_out_and_back():
+    planner = Planner([FakeAxis("lin", 80.0), FakeAxis("rot")], [Rule("clear", "lin", "rot", "0")])
+    assert names(planner.plan([("rot", "45")])) == [[("lin", 0.0)], [("rot", 45.0)], [("lin", 80.0)]]
+
+
+def test_clear_rule_already_safe():
+    planner = Planner([FakeAxis("lin", 0.0), FakeAxis("rot")], [Rule("clear", "lin", "rot", "0")])
+    assert names(planner.plan([("rot", "45"), ("lin", "80")])) == [[("rot", 45.0)], [("lin", 80.0)]]
+
+
+def test_conflicting_clear_positions():
+    rules = [Rule("clear", "lin", "a", "0"), Rule("clear", "lin", "b", "75")]
+    planner = Planner([FakeAxis("lin", 50.0), FakeAxis("a"), FakeAxis("b")], rules)
+    assert planner.plan([("a", "10"), ("b", "10")]) is None
+
+
+def test_contradicting_rules():
+    planner = Planner([FakeAxis("a"), FakeAxis("b")], [Rule("order", "a", "b"), Rule("order", "b", "a")])
+    assert planner.plan([("a", "10"), ("b", "20")]) is None
+
+
+def test_bad_input():
+    planner = Planner([FakeAxis("a")], [])
+    assert planner.plan([("nobody", "10")]) is None
+    assert planner.plan([("a", "far")]) is None
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from MotionModel import MotionModel
+
+
+@pytest.fixture
+def model():
+    # 0.1 rev of ramps in all, up and down
+    return MotionModel(10, 10, 1, 2000)
+
+
+def test_trapezoid(model):
+    # one revolution: 0.1 s up, 0.9 rev at speed, 0.1 s down
+    assert model.move_time(2000) == pytest.approx(1.1)
+
+
+def test_triangle(model):
+    # 0.05 rev never reaches VE, peak sqrt(0.5) rev/sec
+    assert model.move_time(100) == pytest.approx(2 * np.sqrt(0.5) / 10)
+
+
+def test_zero_and_direction(model):
+    assert model.move_time(0) == 0.0
+    assert model.move_time(-2000) == model.move_time(2000)
+
+
+def test_move_times_matches_move_time(model):
+    steps = np.array([0, 1, 100, 199, 200, 201, 2000, -5000])
+    assert model.move_times(steps) == pytest.approx([model.move_time(s) for s in steps])
+
+
+def test_ramp_steps(model):
+    assert model.ramp_steps() == pytest.approx((100, 100))
+
+
+def test_steps_at(model):
+    assert model.steps_at(2000, 0) == 0.0
+    assert model.steps_at(2000, 0.55) == pytest.approx(1000)
+    assert model.steps_at(-2000, 5.0) == -2000
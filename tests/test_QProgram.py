@@ -0,0 +1,33 @@
+import pytest
+import QProgram
+
+
+def test_compile_ends_with_marker():
+    program = QProgram.QProgram("fine").velocity(1).move_relative(100).wait(0.5)
+    assert program.compile() == ["VE1", "FL100", "WT0.50", "SSQfine"]
+
+
+def test_fits():
+    program = QProgram.QProgram("short").move_relative(100)
+    assert program.fits()
+    assert program.size() == len(b"FL100\rSSQshort\r")
+    # the address character counts against the buffer too
+    assert program.size("1") == program.size() + 2
+
+
+def test_too_long_to_fit():
+    program = QProgram.QProgram("long")
+    for i in range(20):
+        program.move_relative(100).wait(0.1)
+    assert program.size() > QProgram.COMMAND_BUFFER_SIZE
+    assert not program.fits()
+
+
+def test_positions():
+    program = QProgram.QProgram("p").move_relative(100).move_to(50).seek_home(7, "F", -1, 0.0).move_relative(10)
+    assert program.positions(0) == [(100, False), (50, False), (0, True), (10, True)]
+
+
+def test_name_must_be_alphanumeric():
+    with pytest.raises(ValueError):
+        QProgram.QProgram("no spaces")
@@ -0,0 +1,116 @@
+import os, select, threading, time, tty
+import pytest
+import SCLBus
+from SCLCommand import SCLTimeoutError
+
+
+class Drive(threading.Thread):
+    """
+    Answers on the far end of a pty: replies[command] is sent back for
+    every command received, after delay seconds
+    """
+    def __init__(self, fd: int, replies: dict, delay: float = 0.0):
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.replies = replies
+        self.delay = delay
+        self.received = []
+        self.running = True
+
+    def run(self):
+        data = b""
+        while self.running:
+            ready, _, _ = select.select([self.fd], [], [], 0.02)
+            if not ready:
+                continue
+            data += os.read(self.fd, 1024)
+            while b"\r" in data:
+                line, data = data.split(b"\r", 1)
+                command = line.decode()
+                self.received.append(command)
+                if command in self.replies:
+                    time.sleep(self.delay)
+                    os.write(self.fd, self.replies[command].encode() + b"\r")
+
+    def stop(self):
+        # must be gone before the pty closes and its fd number is reused
+        self.running = False
+        self.join()
+
+
+@pytest.fixture
+def pty():
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    bus = SCLBus.SCLBus(os.ttyname(slave))
+    yield bus, master
+    bus.ser.close()
+    os.close(master)
+    os.close(slave)
+
+
+def test_read_frame(pty):
+    bus, master = pty
+    os.write(master, b"SP=5\rIP=")
+    assert bus.read_frame(0.5) == b"SP=5"
+    # half a frame is kept for the next call
+    assert bus.read_frame(0.05) is None
+    os.write(master, b"FFFFFFFF\r")
+    assert bus.read_frame(0.5) == b"IP=FFFFFFFF"
+
+
+def test_read_frame_timeout(pty):
+    bus, master = pty
+    start = time.monotonic()
+    assert bus.read_frame(0.1) is None
+    assert 0.09 <= time.monotonic() - start < 0.5
+    # the port timeout is left alone
+    assert bus.ser.timeout == 1.0
+
+
+def test_transact_batch(pty):
+    bus, master = pty
+    drive = Drive(master, {"SP": "SP=12", "IP": "IP=FFFFFFFE", "SSX": "X"})
+    drive.start()
+    try:
+        replies = bus.transact_batch("", ["VE1", "SP", "IP", "SSX"])
+    finally:
+        drive.stop()
+    assert replies[0] is None
+    assert [r.value for r in replies[1:]] == [12, -2, "X"]
+    assert drive.received == ["VE1", "SP", "IP", "SSX"]
+
+
+def test_transact_batch_splits_long_batches(pty):
+    bus, master = pty
+    drive = Drive(master, {"SP": "SP=0"})
+    drive.start()
+    commands = ["AC{}".format(i) for i in range(10, 30)] + ["SP"]
+    try:
+        replies = bus.transact_batch("", commands)
+    finally:
+        drive.stop()
+    assert replies[-1].value == 0
+    assert drive.received == commands
+
+
+def test_transact_timeout(pty):
+    bus, master = pty
+    with pytest.raises(SCLTimeoutError):
+        bus.transact("", "SP", timeout=0.05, retries=0)
+
+
+def test_transact_marked(pty):
+    bus, master = pty
+    drive = Drive(master, {"SSQdone": "Qdone"}, delay=0.2)
+    drive.start()
+    try:
+        replies = bus.transact_marked("", ["FL100", "SSQdone"], 2.0)
+    finally:
+        drive.stop()
+    assert replies[0] is None
+    assert replies[1].value == "Qdone"
+    # the bus is free while the marker is awaited
+    assert bus.holder is None
+    assert bus.markers == {}
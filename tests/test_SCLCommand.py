@@ -0,0 +1,59 @@
+import pytest
+import SCLCommand
+from SCLCommand import SCLNackError
+
+
+def test_encode():
+    assert SCLCommand.encode("", "SC") == b"SC\r"
+    assert SCLCommand.encode("1", "FL200") == b"1FL200\r"
+
+
+def test_strip_address():
+    assert SCLCommand.strip_address("1", "1SP=5") == "SP=5"
+    assert SCLCommand.strip_address("", "SP=5") == "SP=5"
+    # someone else's reply is left as it is so it doesn't match
+    assert SCLCommand.strip_address("1", "2SP=5") == "2SP=5"
+
+
+def test_lookup():
+    assert SCLCommand.lookup("SP2000").code == "SP"
+    assert SCLCommand.lookup("IP").reply == "always"
+    assert SCLCommand.lookup("XX") is None
+
+
+def test_expects_reply():
+    assert SCLCommand.lookup("SP").expects_reply("SP")
+    assert not SCLCommand.lookup("SP").expects_reply("SP0")
+    assert SCLCommand.lookup("SS").expects_reply("SSFOO")
+    assert not SCLCommand.lookup("SA").expects_reply("SA")
+
+
+def test_accept_and_parse():
+    ip = SCLCommand.lookup("IP")
+    assert ip.accept("IP", "IP=FFFFFFFF")
+    assert not ip.accept("IP", "SP=5")
+    assert ip.parse("IP", "IP=FFFFFFFF") == -1
+    ss = SCLCommand.lookup("SS")
+    assert ss.accept("SSFOO", "FOO")
+    assert ss.parse("SSFOO", "FOO") == "FOO"
+
+
+def test_accept_nack():
+    with pytest.raises(SCLNackError):
+        SCLCommand.lookup("SP").accept("SP", "?4")
+
+
+def test_split_batch_short():
+    assert SCLCommand.split_batch("", ["VE1", "FL100"]) == [(b"VE1\rFL100\r", 0.0)]
+
+
+def test_split_batch_receive_buffer():
+    commands = ["DL3", "PR4", "CM21", "AC10", "DE10", "VE10.5", "SP0"]
+    writes = SCLCommand.split_batch("1", commands)
+    assert all(len(chunk) <= SCLCommand.RECEIVE_BUFFER_SIZE for chunk, settle in writes)
+    assert b"".join(chunk for chunk, settle in writes) == b"".join(SCLCommand.encode("1", c) for c in commands)
+
+
+def test_split_batch_settle():
+    writes = SCLCommand.split_batch("", ["AC10", "SA", "SP0"])
+    assert writes == [(b"AC10\rSA\r", SCLCommand.lookup("SA").settle), (b"SP0\r", 0.0)]
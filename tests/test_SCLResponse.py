@@ -0,0 +1,30 @@
+from SCLResponse import parse_hex32, parse_status, parse_alarm, describe, StatusWord, AlarmWord, STATUS_TEXT
+
+
+def test_parse_hex32_positive():
+    assert parse_hex32("00000010") == 16
+    assert parse_hex32("7FFFFFFF") == 2**31 - 1
+
+
+def test_parse_hex32_negative():
+    assert parse_hex32("FFFFFFFF") == -1
+    assert parse_hex32("80000000") == -2**31
+    assert parse_hex32("fffffc18") == -1000
+
+
+def test_parse_status():
+    status = parse_status("0019")
+    assert status == StatusWord.ENABLED | StatusWord.IN_POSITION | StatusWord.MOVING
+    assert not status & StatusWord.ALARM
+
+
+def test_parse_status_ignores_bits_above_16():
+    assert parse_status("10001") == StatusWord.ENABLED
+
+
+def test_parse_alarm():
+    assert parse_alarm("0006") == AlarmWord.CCW_LIMIT | AlarmWord.CW_LIMIT
+
+
+def test_describe():
+    assert describe(StatusWord.ENABLED | StatusWord.MOVING, STATUS_TEXT) == ["Motor Enabled and in position", "Moving"]
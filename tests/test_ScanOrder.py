@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import ScanOrder
+from fakes import FakeAxis
+
+
+def test_path_time():
+    axis = FakeAxis("a")
+    table = ScanOrder.as_table([10.0, 30.0], 1)
+    positions = ScanOrder.drive_positions([axis], table)
+    model = axis.motion_model()
+    assert ScanOrder.path_time([axis], positions, [0, 1]) == pytest.approx(model.move_time(1000) + model.move_time(2000))
+    assert ScanOrder.path_time([axis], positions, [1, 0]) == pytest.approx(model.move_time(3000) + model.move_time(2000))
+
+
+def test_path_time_slowest_axis():
+    a, b = FakeAxis("a"), FakeAxis("b")
+    table = ScanOrder.as_table([(10.0, 50.0)], 2)
+    positions = ScanOrder.drive_positions([a, b], table)
+    assert ScanOrder.path_time([a, b], positions, [0]) == pytest.approx(a.motion_model().move_time(5000))
+
+
+def test_optimize_single_axis_sweeps():
+    assert ScanOrder.optimize([FakeAxis("a")], [50.0, 10.0, 40.0, 20.0]) == [10.0, 20.0, 40.0, 50.0]
+
+
+def test_optimize_grid_keeps_every_point():
+    a, b = FakeAxis("a"), FakeAxis("b")
+    points = [(x, y) for x in (10.0, 20.0, 30.0) for y in (10.0, 40.0)][::-1]
+    ordered = ScanOrder.optimize([a, b], points)
+    assert sorted(ordered) == sorted(points)
+    table = ScanOrder.as_table(points, 2)
+    positions = ScanOrder.drive_positions([a, b], table)
+    given = ScanOrder.path_time([a, b], positions, np.arange(len(points)))
+    best = ScanOrder.path_time([a, b], positions, [points.index(p) for p in ordered])
+    assert best <= given
+
+
+def test_optimize_out_of_range():
+    assert ScanOrder.optimize([FakeAxis("a")], [10.0, 150.0]) is None
+
+
+def test_nearest_neighbor_and_two_opt_visit_every_point():
+    axis = FakeAxis("a")
+    values = np.random.default_rng(0).uniform(0, 100, 50)
+    positions = ScanOrder.drive_positions([axis], ScanOrder.as_table(values, 1))
+    order = ScanOrder.nearest_neighbor([axis], positions)
+    assert sorted(order) == list(range(50))
+    improved = ScanOrder.two_opt(ScanOrder.time_matrix([axis], positions), order)
+    assert sorted(improved) == list(range(50))
+    assert ScanOrder.path_time([axis], positions, improved) <= ScanOrder.path_time([axis], positions, order) + 1e-9